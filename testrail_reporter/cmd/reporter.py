@@ -7,10 +7,14 @@ from datetime import datetime, timedelta
 import pkg_resources
 
 from testrail_reporter.lib.config import Config
-from testrail_reporter.lib.dynamic_parser import DynamicReportParser
-from testrail_reporter.lib.settings import TRR_LOG_FILE, TRR_LOG_LEVEL
+from testrail_reporter.lib.dynamic_parser import stream_reports
+from testrail_reporter.lib.metadatacache import MetadataCache
+from testrail_reporter.lib.settings import (TRR_CONCURRENCY, TRR_LOG_FILE,
+                                            TRR_LOG_LEVEL, TRR_METADATA_CACHE,
+                                            TRR_PAGINATION)
 from testrail_reporter.lib.testcaseparser import TestCaseParser
 from testrail_reporter.lib.testrailanalyzer import (CheckListParser,
+                                                    PlanAnalyzer,
                                                     TestRailAnalyzer)
 from testrail_reporter.lib.testrailproject import TestRailProject
 from testrail_reporter.lib.testrailreporter import TestRailReporter
@@ -24,10 +28,41 @@ LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.StreamHandler(sys.stdout))
 
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            "must be a positive integer: {0}".format(value))
+    return number
+
+
 def log_settings(args, config):
     LOG.debug('URL: "{0}"'.format(config.url))
     LOG.debug('User: "{0}"'.format(config.user))
     LOG.debug('Testrail Project name: "{0}"'.format(args.tr_project))
+    LOG.debug('Async API calls: "{0}" (concurrency: {1})'.format(
+        args.use_async, args.concurrency))
+    LOG.debug('Pagination mode: "{0}"'.format(args.pagination))
+
+
+def get_metadata_cache(args, config):
+    if not args.metadata_cache:
+        return None
+    cache = MetadataCache(config.url, config.user, args.tr_project,
+                          refresh=args.refresh_cache)
+    LOG.debug('Metadata cache: "{0}"'.format(cache.file))
+    return cache
+
+
+def log_http_stats(project):
+    stats = project.client.session.stats()
+    LOG.debug('HTTP requests: {requests}, connections opened: '
+              '{connections}, connections reused: {reused}'.format(**stats))
+    limits = project.client.rate_limiter.stats()
+    LOG.debug('Throttled requests: {throttled}, waited for rate limit: '
+              '{waited:.1f}s'.format(**limits))
+    LOG.debug('Retried requests: {}'.format(
+        project.client.retry_policy.stats() or 0))
 
 
 def analyze(args, config):
@@ -47,15 +82,35 @@ def analyze(args, config):
     project = TestRailProject(url=config.url,
                               user=config.user,
                               password=config.password,
-                              project_name=args.tr_project)
-    analyzer = TestRailAnalyzer(project, args.tr_run, plan_name=args.tr_plan,
-                                configuration=tr_conf)
-    analyzer.analyze_results(check_list_obj)
+                              project_name=args.tr_project,
+                              pagination=args.pagination,
+                              concurrency=args.concurrency,
+                              cache=get_metadata_cache(args, config))
+    try:
+        if args.plan_wide:
+            analyzer = PlanAnalyzer(project, args.tr_plan,
+                                    run_name=args.tr_run,
+                                    configuration=tr_conf,
+                                    use_async=args.use_async,
+                                    concurrency=args.concurrency)
+        else:
+            analyzer = TestRailAnalyzer(project, args.tr_run,
+                                        plan_name=args.tr_plan,
+                                        configuration=tr_conf,
+                                        use_async=args.use_async,
+                                        concurrency=args.concurrency)
+        try:
+            analyzer.analyze_results(check_list_obj, tr_limit=args.tr_limit)
+        finally:
+            analyzer.close()
+    finally:
+        project.close()
+    log_http_stats(project)
 
 
 def publish(args, config):
     LOG.info('========== Publish test results ==========')
-    LOG.info('Report file: "{0}"'.format(args.report_path))
+    LOG.info('Report files: "{0}"'.format('", "'.join(args.report_path)))
     log_settings(args, config)
     LOG.debug('Testrail Test Plan: "{0}"'.format(args.tr_plan))
     LOG.debug('Testrail Test Run: "{0}"'.format(args.tr_run))
@@ -80,25 +135,36 @@ def publish(args, config):
     else:
         tr_conf = None
 
-    parser = DynamicReportParser(args.report_path,
-                                 tr_result_attrs=tr_result_attrs,
-                                 tr_result_map=tr_result_map)
-    results = parser.get_result_list()
+    results = stream_reports(args.report_path,
+                             tr_result_attrs=tr_result_attrs,
+                             tr_result_map=tr_result_map,
+                             text_limit=args.limit,
+                             attachments=args.attachments)
 
     reporter = TestRailReporter(url=config.url,
                                 user=config.user,
                                 password=config.password,
-                                project_name=args.tr_project)
-    reporter.publish_results(results, args.tr_plan, args.tr_suite, args.tr_run,
-                             milestone=args.tr_milestone,
-                             configuration=tr_conf,
-                             update_existing=True,
-                             remove_untested=args.remove_untested,
-                             remove_skipped=args.remove_skipped,
-                             comm_limit=args.limit,
-                             tr_limit=args.tr_limit,
-                             tr_plan_descr=args.tr_plan_descr,
-                             tr_run_descr=args.tr_run_descr)
+                                project_name=args.tr_project,
+                                use_async=args.use_async,
+                                concurrency=args.concurrency,
+                                pagination=args.pagination,
+                                cache=get_metadata_cache(args, config))
+    try:
+        reporter.publish_results(results, args.tr_plan, args.tr_suite,
+                                 args.tr_run,
+                                 milestone=args.tr_milestone,
+                                 configuration=tr_conf,
+                                 update_existing=True,
+                                 remove_untested=args.remove_untested,
+                                 remove_skipped=args.remove_skipped,
+                                 comm_limit=args.limit,
+                                 tr_limit=args.tr_limit,
+                                 tr_plan_descr=args.tr_plan_descr,
+                                 tr_run_descr=args.tr_run_descr,
+                                 delta=args.delta)
+    finally:
+        reporter.close()
+    log_http_stats(reporter.project)
 
 
 def update_suite(args, config):
@@ -127,8 +193,16 @@ def update_suite(args, config):
     reporter = TestRailReporter(url=config.url,
                                 user=config.user,
                                 password=config.password,
-                                project_name=args.tr_project)
-    reporter.update_test_suite(args.tr_suite, tc_list)
+                                project_name=args.tr_project,
+                                use_async=args.use_async,
+                                concurrency=args.concurrency,
+                                pagination=args.pagination,
+                                cache=get_metadata_cache(args, config))
+    try:
+        reporter.update_test_suite(args.tr_suite, tc_list)
+    finally:
+        reporter.close()
+    log_http_stats(reporter.project)
 
 
 def cleanup(args, config):
@@ -143,14 +217,52 @@ def cleanup(args, config):
     reporter = TestRailReporter(url=config.url,
                                 user=config.user,
                                 password=config.password,
-                                project_name=args.tr_project)
-    reporter.cleanup_test_runs(period, remove_completed=args.remove_completed,
-                               user_name=args.tr_user)
+                                project_name=args.tr_project,
+                                use_async=args.use_async,
+                                concurrency=args.concurrency,
+                                pagination=args.pagination,
+                                cache=get_metadata_cache(args, config))
+    try:
+        reporter.cleanup_test_runs(period,
+                                   remove_completed=args.remove_completed,
+                                   user_name=args.tr_user)
+    finally:
+        reporter.close()
+    log_http_stats(reporter.project)
 
 
 def main():
     config = Config()
     parser = argparse.ArgumentParser(prog='testrail-reporter')
+    parser.add_argument(
+        '--async', dest='use_async', action="store_true", default=False,
+        help='Overlap independent TestRail API calls (lookups and bulk '
+             'writes) using asyncio.'
+    )
+    parser.add_argument(
+        '--concurrency', dest='concurrency', default=TRR_CONCURRENCY,
+        type=positive_int,
+        help='Max number of concurrent TestRail API calls. The HTTP '
+             'connection pool (TRR_HTTP_POOL_SIZE) is enlarged to it.'
+    )
+    parser.add_argument(
+        '--pagination', dest='pagination', default=TRR_PAGINATION,
+        choices=TestRailProject.pagination_modes,
+        help='Pagination mode for listings: sequential (default), readahead '
+             '(fetch the next page in background) or parallel (fetch offset '
+             'windows concurrently).'
+    )
+    parser.add_argument(
+        '--metadata-cache', dest='metadata_cache', action="store_true",
+        default=TRR_METADATA_CACHE,
+        help='Cache project metadata (statuses, milestones, configurations, '
+             'etc.) on disk between invocations.'
+    )
+    parser.add_argument(
+        '--refresh-cache', dest='refresh_cache', action="store_true",
+        default=False,
+        help='Reload cached project metadata from TestRail.'
+    )
     subparsers = parser.add_subparsers(help='additional help')
     # ================================ analyze ================================
     parser_a = subparsers.add_parser(
@@ -176,13 +288,24 @@ def main():
         help="Set configuration for test entry (Test Run). "
              "Example: -c \"{'Operating Systems':'Ubuntu 18.04'}\""
     )
+    parser_a.add_argument(
+        '--plan-wide', dest='plan_wide', action="store_true", default=False,
+        help="Analyze all runs of the test plan. Runs can be filtered by "
+             "name (-r) and configuration (-c)."
+    )
+    parser_a.add_argument(
+        '--tr-limit', dest='tr_limit', default=0, type=int,
+        help='Limit for results data sended within one POST request '
+             '(bytes, 0 is unlimited.).'
+    )
     parser_a.set_defaults(func=analyze)
     # ================================ publish ================================
     parser_b = subparsers.add_parser(
         'publish', help='publish test results to TestRail.')
     parser_b.add_argument(
-        'report_path', metavar='Tempest report', type=str,
-        help='Path to tempest report (.xml)'
+        'report_path', metavar='Tempest report', type=str, nargs='+',
+        help='Path to tempest report (.xml). Several reports or glob '
+             'patterns (e.g. "reports/*.xml") are merged into one result set.'
     )
     parser_b.add_argument(
         '-p', dest='tr_project', default=None,
@@ -219,7 +342,8 @@ def main():
     )
     parser_b.add_argument(
         '--limit', dest='limit', default=100000, type=int,
-        help='Limit the length of the comments (characters, 0 is unlimited.)'
+        help='Limit the length of the comments (characters, 0 is unlimited.). '
+             'Logs in XML reports are cut while the report is parsed.'
     )
     parser_b.add_argument(
         '--tr-limit', dest='tr_limit', default=0, type=int,
@@ -254,6 +378,18 @@ def main():
         help='Set path to config file with custom result map. '
              'Note: this parameter overrides predefined map parameter.'
     )
+    parser_b.add_argument(
+        '--attachments', dest='attachments', action="store_true",
+        default=False,
+        help='Upload files attached to test cases in XML reports (properties '
+             '"attachment*" and [[ATTACHMENT|path]] lines in system-out) to '
+             'the published results.'
+    )
+    parser_b.add_argument(
+        '--delta', dest='delta', action="store_true", default=False,
+        help='Publish only results which are new or changed since the last '
+             'publishing to the Test Run from this host.'
+    )
     parser_b.set_defaults(func=publish)
     # ================================ update ================================
     parser_c = subparsers.add_parser(
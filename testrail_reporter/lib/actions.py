@@ -1,22 +1,88 @@
+import functools
+import logging
 import re
+import sys
 
+from testrail_reporter.lib.settings import TRR_ACTIONS_CACHE_SIZE
 
-def perform_actions(string, actions):
-    out = ''
-    for action in actions:
-        if 'custom_map' in action:
-            for key, pattern in action['custom_map'].items():
-                if re.match(pattern, string):
-                    out += key
-        if 'find' in action:
-            f = re.findall(action['find'], string)
-            if not f:
-                return None
-            elif len(f) > 1:
-                Exception("Was found more than one match: {}".format(f))
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+def compile_custom_map(custom_map):
+    """Compile custom_map into a function returning all matched keys.
+
+    All patterns are combined into a single regex of optional lookaheads,
+    so the input is matched in one call. Patterns with their own groups or
+    which can't be combined are matched one by one.
+    """
+    keys = list(custom_map.keys())
+    patterns = [re.compile(pattern) for pattern in custom_map.values()]
+    combined = None
+    if not any(p.groups for p in patterns):
+        try:
+            combined = re.compile(''.join(
+                '(?:(?=(?P<_cm{}>{}))|)'.format(i, p.pattern)
+                for i, p in enumerate(patterns)))
+        except re.error:
+            combined = None
+
+    if combined is None:
+        def match(string):
+            return ''.join(key for key, p in zip(keys, patterns)
+                           if p.match(string))
+        return match
+
+    groups = ['_cm{}'.format(i) for i in range(len(keys))]
+
+    def match_combined(string):
+        m = combined.match(string)
+        return ''.join(key for key, group in zip(keys, groups)
+                       if m.group(group) is not None)
+    return match_combined
+
+
+class CompiledActions(object):
+    """List of string actions with precompiled patterns.
+
+    Results are memoized in a bounded LRU cache, so repeated inputs are
+    processed once.
+    """
+
+    def __init__(self, actions, cache_size=TRR_ACTIONS_CACHE_SIZE):
+        self.steps = []
+        for action in actions:
+            if 'custom_map' in action:
+                self.steps.append(
+                    ('custom_map', compile_custom_map(action['custom_map'])))
+            if 'find' in action:
+                self.steps.append(('find', re.compile(action['find'])))
+            if 'replace' in action:
+                self.steps.append(('replace', (action['replace']['old'],
+                                               action['replace']['new'])))
+        self._perform = functools.lru_cache(maxsize=cache_size)(
+            self._perform_actions)
+
+    def __call__(self, string):
+        return self._perform(string)
+
+    def _perform_actions(self, string):
+        out = ''
+        for action, arg in self.steps:
+            if action == 'custom_map':
+                out += arg(string)
+            elif action == 'find':
+                f = arg.findall(string)
+                if not f:
+                    return None
+                elif len(f) > 1:
+                    LOG.warning("Was found more than one match: {}".format(f))
+                else:
+                    out += f[0]
             else:
-                out += f[0]
-        if 'replace' in action:
-            out = out.replace(action['replace']['old'],
-                              action['replace']['new'])
-    return out
+                out = out.replace(*arg)
+        return out
+
+
+def perform_actions(string, actions):
+    return CompiledActions(actions, cache_size=0)(string)
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import sys
+
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+from testrail_reporter.lib.workerpool import WorkerPool
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class AttachmentUploader(WorkerPool):
+    """Upload files attached to test results of a run once per content.
+
+    Files are identified by SHA-256 of their content. `link` prepares
+    results for publishing: the first result referencing a file owns it,
+    the file is uploaded to the result by `attach` once the result is
+    created. Results referencing uploaded files get links to them in
+    their comments (`files` maps digests to attachment ids).
+
+    Results can't be changed once they are created, so a result
+    referencing a file which is being uploaded is deferred together with
+    the following results of its test. They are collected in `deferred`
+    to be linked and published after the uploads are done.
+    """
+    action = 'upload attachment'
+    unit = 'files'
+    verb = 'uploaded'
+
+    def __init__(self, project, workers=TRR_CONCURRENCY):
+        super(AttachmentUploader, self).__init__(workers)
+        self.project = project
+        self.files = {}
+        self.deferred = []
+        self.linked = 0
+        self.bytes = 0
+        self._hashes = {}
+        self._uploading = set()
+        self._failed = set()
+
+    def _hash_file(self, path, chunk_size=65536):
+        if path not in self._hashes:
+            sha = hashlib.sha256()
+            try:
+                with open(path, 'rb') as stream:
+                    for chunk in iter(lambda: stream.read(chunk_size), b''):
+                        sha.update(chunk)
+            except OSError as e:
+                self._hashes[path] = None
+                self._fail((path,), e)
+            else:
+                self._hashes[path] = sha.hexdigest()
+        return self._hashes[path]
+
+    @staticmethod
+    def _make_link(path, attachment_id):
+        name = os.path.basename(path)
+        link = f"[{name}](index.php?/attachments/get/{attachment_id})"
+        mimetype = mimetypes.guess_type(path)[0]
+        if mimetype and mimetype.startswith('image/'):
+            return "!" + link
+        return link
+
+    def link(self, results):
+        """Yield results ready for publishing.
+
+        'attachments' of a yielded result are replaced by (digest, path)
+        pairs of the files it owns.
+        """
+        self.deferred = []
+        deferred_tests = set()
+        for res in results:
+            files = {}
+            for path in res.get('attachments') or ():
+                digest = self._hash_file(path)
+                if digest is not None:
+                    files.setdefault(digest, path)
+            with self._lock:
+                if res['test_id'] in deferred_tests or \
+                        not self._uploading.isdisjoint(files):
+                    self.deferred.append(res)
+                    deferred_tests.add(res['test_id'])
+                    continue
+                owned = [(digest, path) for digest, path in files.items()
+                         if digest not in self.files and
+                         digest not in self._failed]
+                self._uploading.update(digest for digest, _ in owned)
+                links = [self._make_link(path, self.files[digest])
+                         for digest, path in files.items()
+                         if digest in self.files]
+            res['attachments'] = owned
+            if links:
+                self.linked += len(links)
+                res['comment'] = "\n".join(
+                    [res.get('comment') or '', "Attachments:"] +
+                    ["- " + link for link in links]).lstrip("\n")
+            yield res
+
+    def task(self, result_id, digest, path):
+        LOG.info(f"Upload attachment {path} to result {result_id}")
+        try:
+            attachment = self.project.add_attachment_to_result(result_id,
+                                                               path)
+        except Exception:
+            with self._lock:
+                self._uploading.discard(digest)
+                self._failed.add(digest)
+            raise
+        with self._lock:
+            self._uploading.discard(digest)
+            self.files[digest] = attachment['attachment_id']
+            self.bytes += os.path.getsize(path)
+
+    def label(self, *args):
+        return args[-1]
+
+    def attach(self, result_id, files):
+        """Queue upload of (digest, path) files owned by the result."""
+        for digest, path in files:
+            self.submit(result_id, digest, path)
+
+    def summary(self):
+        return (f"{self.done} files ({self.bytes} bytes) uploaded, "
+                f"{self.linked} links to uploaded files, "
+                f"{len(self.failed)} failed in {self.time:.3f}s by "
+                f"{self.workers} workers")
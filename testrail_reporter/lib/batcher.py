@@ -0,0 +1,83 @@
+import collections
+import json
+import logging
+import sys
+import time
+
+from testrail_reporter.lib.records import to_json
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+Batch = collections.namedtuple('Batch',
+                               ('payload', 'test_ids', 'attachments'))
+
+
+class ResultBatcher(object):
+    """Split results into add_results payloads bounded in UTF-8 size.
+
+    Every result is serialized once; the batch size is tracked as a
+    running total of encoded bytes, so the produced payload (sent as is)
+    never exceeds the limit. A single result bigger than the limit is sent
+    in a batch of its own. The last partial batch is always emitted.
+
+    Files attached to results ('attachments' paths) aren't part of the
+    payload; they're kept in the batch in the order of the results.
+    """
+    prefix = b'{"results": ['
+    separator = b', '
+    suffix = b']}'
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.batches = 0
+        self.entries = 0
+        self.bytes = 0
+        self.time = 0.0
+
+    def _make_batch(self, parts, test_ids, attachments):
+        payload = self.prefix + self.separator.join(parts) + self.suffix
+        self.batches += 1
+        self.entries += len(test_ids)
+        self.bytes += len(payload)
+        return Batch(payload, test_ids, attachments)
+
+    def split(self, results):
+        start = time.perf_counter()
+        empty_size = len(self.prefix) + len(self.suffix)
+        parts = []
+        test_ids = []
+        attachments = []
+        size = empty_size
+        for res in results:
+            paths = res.pop('attachments', None)
+            part = json.dumps(res, default=to_json).encode('utf-8')
+            added = len(part) + (len(self.separator) if parts else 0)
+            if self.limit and parts and size + added > self.limit:
+                batch = self._make_batch(parts, test_ids, attachments)
+                self.time += time.perf_counter() - start
+                yield batch
+                start = time.perf_counter()
+                parts = []
+                test_ids = []
+                attachments = []
+                size = empty_size
+                added = len(part)
+            if self.limit and size + added > self.limit:
+                LOG.warning(f"Result for test {res['test_id']} exceeds the "
+                            f"results data limit ({self.limit} bytes) and "
+                            f"will be sent within a separate request.")
+            parts.append(part)
+            test_ids.append(res['test_id'])
+            attachments.append(paths)
+            size += added
+        if parts:
+            batch = self._make_batch(parts, test_ids, attachments)
+            self.time += time.perf_counter() - start
+            yield batch
+        else:
+            self.time += time.perf_counter() - start
+
+    def summary(self):
+        return (f"{self.entries} results ({self.bytes} bytes) in "
+                f"{self.batches} batches, batching took {self.time:.3f}s")
@@ -0,0 +1,23 @@
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+from testrail_reporter.lib.workerpool import WorkerPool
+
+
+class CaseCreator(WorkerPool):
+    """Create test cases from (section_id, case data) items.
+
+    Sections must exist before their cases are produced.
+    """
+    action = 'create case'
+    unit = 'cases'
+    verb = 'created'
+
+    def __init__(self, project, workers=TRR_CONCURRENCY, total=0, progress_interval=10):
+        super(CaseCreator, self).__init__(workers, total=total,
+                                          progress_interval=progress_interval)
+        self.project = project
+
+    def task(self, section_id, tc):
+        self.project.add_case(section_id, tc)
+
+    def label(self, section_id, tc):
+        return tc['title']
@@ -1,5 +1,6 @@
 import csv
 
+from testrail_reporter.lib.records import record_type
 from testrail_reporter.lib.reportparser import ReportParser
 
 
@@ -18,19 +19,15 @@ class CSVParser(ReportParser):
             val = self.convert(val, map['convert_type'])
         return val
 
-    def get_result_list(self):
-        results = {'results': [],
-                   'results_setup': [],
-                   'results_teardown': []}
+    def iter_results(self):
+        result_type = record_type(self.tr_result_map)
         with open(self.file, newline='') as csvfile:
             reader = csv.DictReader(csvfile)
             for row in reader:
-                tc_res = {key: None for key in self.tr_result_map.keys()}
+                tc_res = result_type()
                 for key_trm, map_trm in self.tr_result_map.items():
                     tc_res[key_trm] = self._process_map(row, map_trm)
                 # Drop aggregated results
                 if tc_res['test_id'] == "Aggregated":
                     continue
-                self.raw_results.append(tc_res)
-        results['results'] = self.raw_results
-        return results
+                yield 'results', tc_res
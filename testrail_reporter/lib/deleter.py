@@ -0,0 +1,30 @@
+import logging
+import sys
+
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+from testrail_reporter.lib.workerpool import WorkerPool
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class RunDeleter(WorkerPool):
+    """Delete test runs and plans from (kind, run or plan) items."""
+    action = 'delete the test'
+    unit = 'runs and plans'
+    verb = 'deleted'
+
+    def __init__(self, project, workers=TRR_CONCURRENCY):
+        super(RunDeleter, self).__init__(workers)
+        self.project = project
+
+    def task(self, kind, item):
+        LOG.warning(f"Deleting the test {kind} (id: {item['id']}): "
+                    f"{item['name']}")
+        if kind == 'run':
+            self.project.delete_run(item['id'])
+        else:
+            self.project.delete_plan(item['id'])
+
+    def label(self, kind, item):
+        return f"{kind} {item['name']}"
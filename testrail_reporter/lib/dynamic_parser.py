@@ -1,6 +1,10 @@
+import functools
+import glob
 import os
 
 from testrail_reporter.lib.csv_parser import CSVParser
+from testrail_reporter.lib.resultstream import ResultStream, scan_results
+from testrail_reporter.lib.settings import TRR_PARSE_WORKERS
 from testrail_reporter.lib.xml_parser import XMLParser
 
 
@@ -17,3 +21,41 @@ class DynamicReportParser(object):
         else:
             raise ValueError(f"Unsupported file type: "
                              f"{self.file_name}{self.file_extension}")
+
+
+def expand_report_paths(paths):
+    """Expand glob patterns of report paths, keeping the order."""
+    files = []
+    for path in paths:
+        matches = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        if not matches:
+            raise ValueError(f"No reports match: {path}")
+        for file in matches:
+            if file not in files:
+                files.append(file)
+    return files
+
+
+def _scan_report(file, tr_result_attrs, tr_result_map, text_limit=0,
+                 attachments=False):
+    parser = DynamicReportParser(file, tr_result_attrs=tr_result_attrs,
+                                 tr_result_map=tr_result_map,
+                                 text_limit=text_limit,
+                                 attachments=attachments)
+    return scan_results(parser.iter_results())
+
+
+def stream_reports(paths, tr_result_attrs, tr_result_map,
+                   workers=TRR_PARSE_WORKERS, text_limit=0, attachments=False):
+    """Return ResultStream of reports for publishing.
+
+    paths may contain glob patterns. Every report is parsed once, several
+    reports are parsed in a process pool (workers 0 means the number of
+    CPUs). Results are streamed in the order of the reports.
+    """
+    files = expand_report_paths(paths)
+    return ResultStream(
+        [functools.partial(_scan_report, file, tr_result_attrs,
+                           tr_result_map, text_limit, attachments)
+         for file in files],
+        workers=workers)
@@ -35,3 +35,11 @@ class Conflict(ReporterException):
 
 class UnknownAction(ReporterException):
     message = "Unknown action: {action}"
+
+
+class CreationFailed(ReporterException):
+    message = "Failed to create {count} test cases"
+
+
+class DeletionFailed(ReporterException):
+    message = "Failed to delete {count} test runs and plans"
@@ -0,0 +1,69 @@
+import collections
+import hashlib
+import json
+import os
+
+from testrail_reporter.lib.jsonfile import read_json, write_json
+from testrail_reporter.lib.settings import TRR_CACHE_DIR
+
+
+class FingerprintStore(object):
+    """Local store of fingerprints of results published to a test run.
+
+    A fingerprint is a hash of status, comment, defects, version and custom
+    fields of all results of a test (in order). The store is a JSON file
+    per test run, so publishing to the same run again may skip the tests
+    whose results haven't changed.
+    """
+    fields = ('status_id', 'comment', 'defects', 'version')
+
+    def __init__(self, run_url, path=TRR_CACHE_DIR):
+        key = hashlib.sha256(run_url.encode('utf-8')).hexdigest()[:16]
+        self.file = os.path.join(path, 'fingerprints', '{}.json'.format(key))
+        self._data = read_json(self.file, {})
+        self.total = 0
+        self.changed = 0
+
+    def save(self):
+        write_json(self.file, self._data)
+
+    @classmethod
+    def _fingerprint(cls, results):
+        digest = hashlib.sha256()
+        for res in results:
+            data = {k: v for k, v in res.items()
+                    if k in cls.fields or k.startswith('custom_')}
+            digest.update(json.dumps(data, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _filter_test(self, test_id, results):
+        self.total += len(results)
+        fingerprint = self._fingerprint(results)
+        if self._data.get(str(test_id)) == fingerprint:
+            return []
+        self._data[str(test_id)] = fingerprint
+        self.changed += len(results)
+        return results
+
+    def filter_changed(self, results, counts=None):
+        """Yield results of tests which are new or changed.
+
+        Results of a test are held until all of them are seen: `counts` is
+        the number of results by test id, results of tests missing in it
+        are held until the end. Results of different tests may be yielded
+        out of order, results of a test keep their order.
+
+        Fingerprints of the yielded tests are updated in memory, call
+        `save` once the results are published.
+        """
+        counts = counts or {}
+        pending = collections.OrderedDict()
+        for res in results:
+            test_id = res['test_id']
+            test_results = pending.setdefault(test_id, [])
+            test_results.append(res)
+            if len(test_results) == counts.get(test_id):
+                del pending[test_id]
+                yield from self._filter_test(test_id, test_results)
+        for test_id, test_results in pending.items():
+            yield from self._filter_test(test_id, test_results)
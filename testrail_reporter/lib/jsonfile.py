@@ -0,0 +1,35 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+def read_json(file, default=None):
+    """Return data of a JSON file or default if it's missing or corrupted.
+
+    Errors other than a missing file are logged.
+    """
+    try:
+        with open(file, 'r') as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        LOG.warning("Can't read {}: {}".format(file, e))
+    return default
+
+
+def write_json(file, data):
+    """Write data to a JSON file atomically, errors are logged."""
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file))
+        with os.fdopen(fd, 'w') as stream:
+            json.dump(data, stream)
+        os.replace(tmp, file)
+    except OSError as e:
+        LOG.warning("Can't write {}: {}".format(file, e))
@@ -0,0 +1,65 @@
+import collections
+
+
+class MultiPatternMatcher(object):
+    """Aho-Corasick automaton for substring matching of many patterns.
+
+    The automaton is built once; `search` scans a text in a single pass and
+    returns indexes of all patterns found in it. Result is equal to
+    checking `pattern in text` for every pattern.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._out_link = [0]
+        for i, pattern in enumerate(self.patterns):
+            self._add(pattern, i)
+        self._build()
+
+    def _add(self, pattern, index):
+        state = 0
+        for char in pattern:
+            nxt = self._goto[state].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._out_link.append(0)
+            state = nxt
+        self._out[state].append(index)
+
+    def _build(self):
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[nxt] = fail
+                # Nearest state on the fail chain which has own outputs
+                self._out_link[nxt] = fail if self._out[fail] \
+                    else self._out_link[fail]
+
+    def search(self, text):
+        """Return sorted indexes of patterns which are substrings of text."""
+        found = set(self._out[0])
+        goto = self._goto
+        fail = self._fail
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            out = state
+            while out:
+                found.update(self._out[out])
+                out = self._out_link[out]
+        return sorted(found)
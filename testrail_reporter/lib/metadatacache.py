@@ -0,0 +1,61 @@
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+
+from testrail_reporter.lib.jsonfile import read_json, write_json
+from testrail_reporter.lib.settings import TRR_CACHE_DIR, TRR_CACHE_TTLS
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class MetadataCache(object):
+    """Persistent on-disk cache of TestRail project metadata.
+
+    Entries (statuses, milestones, configurations, etc.) are stored in a
+    JSON file per TestRail URL, user and project. Every entity has its own
+    TTL; expired or missing entries are loaded from TestRail and saved.
+    """
+
+    def __init__(self, url, user, project_name, path=TRR_CACHE_DIR,
+                 ttls=None, refresh=False):
+        key = hashlib.sha256(
+            '\n'.join((url, user or '', project_name or '')).encode('utf-8')
+        ).hexdigest()[:16]
+        self.file = os.path.join(path, '{}.json'.format(key))
+        self.ttls = dict(TRR_CACHE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self._lock = threading.Lock()
+        self._data = {}
+        if not refresh:
+            self._read()
+
+    def _read(self):
+        self._data = read_json(self.file, {})
+
+    def _write(self):
+        write_json(self.file, self._data)
+
+    def get(self, entity):
+        """Return cached value or None if it's missing or expired."""
+        with self._lock:
+            entry = self._data.get(entity)
+        if entry is None:
+            return None
+        if time.time() - entry['time'] > self.ttls.get(entity, 0):
+            return None
+        return entry['value']
+
+    def set(self, entity, value):
+        with self._lock:
+            self._data[entity] = {'time': time.time(), 'value': value}
+            self._write()
+
+    def invalidate(self, entity):
+        with self._lock:
+            if self._data.pop(entity, None) is not None:
+                self._write()
@@ -0,0 +1,107 @@
+import collections
+import threading
+import time
+
+from testrail_reporter.lib.settings import TRR_RATE_LIMIT, TRR_RATE_LIMIT_MIN
+
+
+class RateLimiter(object):
+    """Thread-safe token bucket adapting its rate to throttling feedback.
+
+    The bucket holds up to one second worth of requests. With rate 0 the
+    requests aren't limited until the server throttles them; the initial
+    rate is then estimated from the requests of the last seconds.
+
+    The rate is halved on throttling (at most once per `cooldown`
+    seconds, as concurrent requests are throttled together) and all
+    requests are paused for the Retry-After delay. Each successful request
+    increases the rate by `increase` requests per second, up to the
+    configured (or initially estimated) rate.
+    """
+
+    def __init__(self, rate=TRR_RATE_LIMIT, min_rate=TRR_RATE_LIMIT_MIN,
+                 increase=0.05, cooldown=1.0, window=5.0):
+        self.max_rate = rate or None
+        self.rate = self.max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.cooldown = cooldown
+        self.window = window
+        self.throttled = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+        self._tokens = max(self.rate or 1, 1)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._decreased = 0.0
+        self._recent = collections.deque()
+
+    def _observed_rate(self, now):
+        while self._recent and self._recent[0] < now - self.window:
+            self._recent.popleft()
+        if not self._recent:
+            return self.min_rate
+        return len(self._recent) / max(now - self._recent[0], 1.0)
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._paused_until - now
+                if delay <= 0:
+                    if self.rate is None:
+                        self._recent.append(now)
+                        self._observed_rate(now)
+                        return
+                    self._tokens = min(
+                        max(self.rate, 1),
+                        self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    delay = (1 - self._tokens) / self.rate
+                self.waited += delay
+            time.sleep(delay)
+
+    def on_throttled(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            if retry_after:
+                self._paused_until = max(self._paused_until,
+                                         now + retry_after)
+            if now - self._decreased < self.cooldown:
+                return
+            if self.rate is None:
+                # The estimated rate also caps the following increase
+                self.max_rate = max(self._observed_rate(now), self.min_rate)
+            self.rate = max((self.rate or self.max_rate) / 2, self.min_rate)
+            self._tokens = 0
+            self._updated = now
+            self._decreased = now
+
+    def on_success(self):
+        if self.rate is None or self.rate == self.max_rate:
+            return
+        with self._lock:
+            self.rate = min(self.rate + self.increase, self.max_rate)
+
+    def stats(self):
+        return {'throttled': self.throttled,
+                'waited': self.waited,
+                'rate': self.rate}
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the rate limiter shared by all API clients of the process."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RateLimiter()
+        return _shared
@@ -0,0 +1,92 @@
+import collections.abc
+import functools
+
+
+class Record(collections.abc.MutableMapping):
+    """Compact mapping with a fixed set of fields stored in slots.
+
+    Records are used instead of per-test dict copies of result and case
+    templates: field names are stored once per record type instead of a
+    hash table per record. A field without a value (e.g. removed with
+    `pop`) isn't a key of the record. Use `record_type` to create record
+    types and `to_json` as `default` of json.dumps to serialize records.
+    """
+    __slots__ = ()
+    fields = ()
+    _field_set = frozenset()
+
+    def __init__(self, values=()):
+        if isinstance(values, collections.abc.Mapping):
+            values = values.items()
+        for key, value in values:
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self._field_set:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self._field_set:
+            raise KeyError("Unknown field of the record: {}".format(key))
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        delattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._field_set and hasattr(self, key)
+
+    def __iter__(self):
+        return (field for field in self.fields if hasattr(self, field))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __copy__(self):
+        return type(self)((field, getattr(self, field)) for field in self)
+
+    def __reduce__(self):
+        return _make_record, (self.fields, self.to_dict())
+
+    def __repr__(self):
+        return 'Record({!r})'.format(self.to_dict())
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self}
+
+
+@functools.lru_cache(maxsize=None)
+def _record_type(fields):
+    return type('Record', (Record,), {'__slots__': fields,
+                                      'fields': fields,
+                                      '_field_set': frozenset(fields)})
+
+
+def record_type(*field_lists):
+    """Return record type with fields from field_lists (in order).
+
+    Record types are cached, so records are picklable as long as the same
+    fields are used.
+    """
+    fields = []
+    for field_list in field_lists:
+        fields.extend(f for f in field_list if f not in fields)
+    return _record_type(tuple(fields))
+
+
+def _make_record(fields, values):
+    return _record_type(fields)(values)
+
+
+def to_json(obj):
+    """`default` for json.dumps serializing records as objects."""
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(obj).__name__))
@@ -1,15 +1,22 @@
+import abc
+
 import yaml
 
 
-class ReportParser(object):
+class ReportParser(abc.ABC):
 
-    def __init__(self, file, tr_result_attrs, tr_result_map):
+    def __init__(self, file, tr_result_attrs, tr_result_map, text_limit=0,
+                 attachments=False):
+        """text_limit limits the length of texts (e.g. logs) kept by parsers
+        which support it, 0 is unlimited. With attachments parsers which
+        support it collect paths of test artifacts in 'attachments'."""
         self.file = file
+        self.text_limit = text_limit
+        self.attachments = attachments
         with open(tr_result_attrs, 'r') as stream:
             self.tr_result_attrs = yaml.safe_load(stream)
         with open(tr_result_map, 'r') as stream:
             self.tr_result_map = yaml.safe_load(stream)
-        self.raw_results = []
 
     @staticmethod
     def convert(value, ctype):
@@ -24,5 +31,17 @@ class ReportParser(object):
         else:
             raise Exception(f"Unknown type for conversion: {ctype}")
 
+    @abc.abstractmethod
+    def iter_results(self):
+        """Yield (group, result) pairs while parsing the report.
+
+        group is one of 'results', 'results_setup', 'results_teardown'.
+        """
+
     def get_result_list(self):
-        pass
+        results = {'results': [],
+                   'results_setup': [],
+                   'results_teardown': []}
+        for group, res in self.iter_results():
+            results[group].append(res)
+        return results
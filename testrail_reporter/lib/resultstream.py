@@ -0,0 +1,202 @@
+import collections
+import os
+import pickle
+import queue
+import tempfile
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+ReportScan = collections.namedtuple(
+    'ReportScan', ('spool', 'results', 'titles', 'statuses',
+                   'results_setup', 'results_teardown'))
+
+
+def _remove_spools(scans):
+    for scan in scans:
+        if scan.spool is not None:
+            try:
+                os.remove(scan.spool)
+            except FileNotFoundError:
+                pass
+    del scans[:]
+
+
+def scan_results(results, spool=True):
+    """Scan (group, result) pairs of a report and return ReportScan.
+
+    Setup and teardown groups, titles and status labels of test results
+    are collected. Test results are written to a temporary spool file, or
+    kept in memory if `spool` is False.
+    """
+    titles = []
+    statuses = set()
+    groups = {'results_setup': [], 'results_teardown': []}
+    kept = []
+    stream = None
+    path = None
+    if spool:
+        fd, path = tempfile.mkstemp(prefix='testrail-reporter-',
+                                    suffix='.spool')
+        stream = os.fdopen(fd, 'wb')
+    try:
+        for group, res in results:
+            if group != 'results':
+                groups[group].append(res)
+                continue
+            titles.append(res['test_id'])
+            if isinstance(res['status_id'], str):
+                statuses.add(res['status_id'])
+            if stream is not None:
+                pickle.dump(res, stream, pickle.HIGHEST_PROTOCOL)
+            else:
+                kept.append(res)
+    except BaseException:
+        if stream is not None:
+            stream.close()
+            os.remove(path)
+        raise
+    if stream is not None:
+        stream.close()
+    return ReportScan(path, kept, titles, statuses,
+                      groups['results_setup'], groups['results_teardown'])
+
+
+def _iter_result_list(results):
+    for group in ('results', 'results_setup', 'results_teardown'):
+        for res in results.get(group, []):
+            yield group, res
+
+
+def _read_ahead(iterable, size, chunk_size=100):
+    """Iterate over iterable in a background thread.
+
+    Items are passed in chunks through a queue of `size` chunks, so the
+    producer is at most `size` chunks ahead of the consumer.
+    """
+    chunks = queue.Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                chunks.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        error = None
+        chunk = []
+        try:
+            for item in iterable:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    if not put(chunk):
+                        return
+                    chunk = []
+            if chunk and not put(chunk):
+                return
+        except Exception as e:
+            error = e
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+        put((done, error))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if isinstance(chunk, tuple) and chunk[0] is done:
+                if chunk[1] is not None:
+                    raise chunk[1]
+                return
+            yield from chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+class ResultStream(object):
+    """Results of one or several reports for streaming publishing.
+
+    Reports are given as callables returning ReportScan (see
+    `scan_results`). `scan` parses every report once. It collects setup
+    and teardown groups, titles and status labels of test results, which
+    are needed before any result is published, and spools test results to
+    temporary files. Several reports are scanned in a process pool of
+    `workers` (0 - number of CPUs), so the callables must be picklable.
+
+    Iterating the stream yields test results read from the spools in a
+    background thread through a bounded queue. Reading overlaps with
+    preparation and upload of the results, and memory consumption doesn't
+    depend on the number of results, except for their titles. `close`
+    removes the spool files.
+    """
+
+    def __init__(self, reports, workers=1, queue_size=10):
+        self.reports = list(reports)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.titles = []
+        self.statuses = set()
+        self.results_setup = []
+        self.results_teardown = []
+        self._scans = []
+        self._finalizer = weakref.finalize(self, _remove_spools, self._scans)
+
+    @classmethod
+    def from_results(cls, results):
+        """Stream results dict returned by ReportParser.get_result_list."""
+        return cls([lambda: scan_results(_iter_result_list(results),
+                                         spool=False)])
+
+    def _scan_reports(self):
+        workers = min(self.workers or os.cpu_count() or 1, len(self.reports))
+        if workers <= 1:
+            for report in self.reports:
+                self._scans.append(report())
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(report) for report in self.reports]
+        # Keep all spools to remove them if any report has failed
+        self._scans.extend(future.result() for future in futures
+                           if future.exception() is None)
+        for future in futures:
+            if future.exception() is not None:
+                raise future.exception()
+
+    def scan(self):
+        self.close()
+        self._scan_reports()
+        self.titles = []
+        self.statuses = set()
+        self.results_setup = []
+        self.results_teardown = []
+        for scan in self._scans:
+            self.titles.extend(scan.titles)
+            self.statuses.update(scan.statuses)
+            self.results_setup.extend(scan.results_setup)
+            self.results_teardown.extend(scan.results_teardown)
+
+    def _iter_scanned(self):
+        for scan in self._scans:
+            if scan.spool is None:
+                yield from scan.results
+                continue
+            with open(scan.spool, 'rb') as stream:
+                while True:
+                    try:
+                        yield pickle.load(stream)
+                    except EOFError:
+                        break
+
+    def __iter__(self):
+        return _read_ahead(self._iter_scanned(), self.queue_size)
+
+    def close(self):
+        _remove_spools(self._scans)
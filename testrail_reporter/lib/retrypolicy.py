@@ -0,0 +1,73 @@
+import collections
+import random
+import threading
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from testrail_reporter.lib.settings import (TRR_RETRIES, TRR_RETRY_BACKOFF,
+                                            TRR_RETRY_BACKOFF_MAX)
+
+
+class RetryPolicy(object):
+    """Exponential backoff with full jitter per class of errors.
+
+    Errors are classified as throttled (HTTP 429), server (HTTP 5xx),
+    timeout (no response in time) and connection (e.g. a reset keep-alive
+    connection). Server errors, timeouts and connection errors are retried
+    only for GET requests, as a write might have been applied before the
+    failure, unless the connection failed before the request was sent.
+    """
+    idempotent_only = ('server', 'timeout', 'connection')
+
+    def __init__(self, retries=None, backoff=TRR_RETRY_BACKOFF,
+                 backoff_max=TRR_RETRY_BACKOFF_MAX):
+        self.retries = dict(TRR_RETRIES)
+        self.retries.update(retries or {})
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.retried = collections.Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def classify(error):
+        """Return the class of the error or None if it isn't retryable."""
+        code = getattr(error, 'response_code', None)
+        if code == 429:
+            return 'throttled'
+        if code is not None and code >= 500:
+            return 'server'
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return 'connection'
+        if isinstance(error, requests.exceptions.Timeout):
+            return 'timeout'
+        return None
+
+    @staticmethod
+    def is_sent(error):
+        """Return False if the request failed before it was sent."""
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return False
+        if isinstance(error, requests.exceptions.ConnectionError) and \
+                error.args:
+            reason = getattr(error.args[0], 'reason', error.args[0])
+            return not isinstance(reason, NewConnectionError)
+        return True
+
+    def get_delay(self, error_class, method, attempt, retry_after=None,
+                  sent=True):
+        """Return the delay before the next attempt or None to give up."""
+        if error_class is None or attempt >= self.retries.get(error_class, 0):
+            return None
+        if method != 'GET' and sent and error_class in self.idempotent_only:
+            return None
+        with self._lock:
+            self.retried[error_class] += 1
+        delay = random.uniform(
+            0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        if retry_after:
+            delay += retry_after
+        return delay
+
+    def stats(self):
+        return dict(self.retried)
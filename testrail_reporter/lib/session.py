@@ -0,0 +1,143 @@
+import base64
+import os
+import threading
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from testrail_reporter.lib.settings import (TRR_HTTP_KEEP_ALIVE,
+                                            TRR_HTTP_POOL_SIZE,
+                                            TRR_HTTP_TIMEOUT)
+
+
+class MultipartFile(object):
+    """Streaming multipart/form-data body with a single file field.
+
+    The file is read from disk in chunks while the request is sent, so it
+    is never loaded into memory. The length is known in advance, so the
+    request is sent with Content-Length.
+    """
+
+    def __init__(self, path, field='attachment', chunk_size=65536):
+        self.path = path
+        self.chunk_size = chunk_size
+        boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=' + boundary
+        filename = os.path.basename(path).replace('"', '')
+        self._parts = [
+            ('--{}\r\nContent-Disposition: form-data; name="{}"; '
+             'filename="{}"\r\nContent-Type: application/octet-stream'
+             '\r\n\r\n'.format(boundary, field, filename)).encode('utf-8'),
+            None,
+            '\r\n--{}--\r\n'.format(boundary).encode('utf-8')]
+        self._length = (len(self._parts[0]) + os.path.getsize(path) +
+                        len(self._parts[2]))
+        self._file = None
+        self._index = 0
+        self._buffer = b''
+
+    def __len__(self):
+        return self._length
+
+    def _next_chunk(self):
+        while self._index < len(self._parts):
+            part = self._parts[self._index]
+            if part is not None:
+                self._index += 1
+                return part
+            if self._file is None:
+                self._file = open(self.path, 'rb')
+            chunk = self._file.read(self.chunk_size)
+            if chunk:
+                return chunk
+            self.close()
+            self._index += 1
+        return b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TestRailSession(object):
+    """Connection-pooled HTTP session shared by TestRail API clients.
+
+    A single session keeps TCP/TLS connections alive between requests, so
+    paginated listings and bulk writes don't pay a handshake per call. The
+    underlying urllib3 pool is thread-safe and blocks when all connections
+    are busy instead of opening throwaway ones.
+    """
+
+    def __init__(self, user='', password='', pool_size=TRR_HTTP_POOL_SIZE,
+                 keep_alive=TRR_HTTP_KEEP_ALIVE, timeout=TRR_HTTP_TIMEOUT):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1,
+                                    pool_maxsize=pool_size,
+                                    pool_block=True)
+        self._session.mount('http://', self._adapter)
+        self._session.mount('https://', self._adapter)
+        self.headers = {}
+        self.json_headers = {}
+        self.set_credentials(user, password)
+
+    def set_credentials(self, user, password):
+        auth = str(
+            base64.b64encode(
+                bytes('%s:%s' % (user, password), 'utf-8')
+            ),
+            'ascii'
+        ).strip()
+        headers = {'Authorization': 'Basic ' + auth,
+                   'Connection': 'keep-alive' if self.keep_alive else 'close'}
+        json_headers = dict(headers)
+        json_headers['Content-Type'] = 'application/json'
+        with self._lock:
+            self.headers = headers
+            self.json_headers = json_headers
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, self.json_headers, **kwargs)
+
+    def post(self, url, json_body=True, content_type=None, **kwargs):
+        headers = self.json_headers if json_body else self.headers
+        if content_type:
+            headers = dict(headers)
+            headers['Content-Type'] = content_type
+        return self.request('POST', url, headers, **kwargs)
+
+    def request(self, method, url, headers, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self._session.request(method, url, headers=headers, **kwargs)
+
+    def stats(self):
+        """Return the number of requests, opened and reused connections."""
+        requests_num = 0
+        connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            requests_num += pool.num_requests
+            connections += pool.num_connections
+        return {'requests': requests_num,
+                'connections': connections,
+                'reused': max(requests_num - connections, 0)}
+
+    def close(self):
+        self._session.close()
@@ -6,3 +6,50 @@ TRR_LOG_FILE = os.environ.get(
 )
 TRR_LOG_LEVEL = os.environ.get("TRR_LOG_LEVEL", "DEBUG")
 TRR_TITLE_MAX_LENGTH = int(os.environ.get("TRR_TITLE_MAX_LENGTH", 250))
+
+# HTTP connection pool
+TRR_HTTP_POOL_SIZE = int(os.environ.get("TRR_HTTP_POOL_SIZE", 10))
+TRR_HTTP_KEEP_ALIVE = os.environ.get(
+    "TRR_HTTP_KEEP_ALIVE", "true").lower() in ("1", "true", "yes")
+TRR_HTTP_TIMEOUT = float(os.environ.get("TRR_HTTP_TIMEOUT", 0)) or None
+
+# Concurrency
+TRR_CONCURRENCY = int(os.environ.get("TRR_CONCURRENCY", 8))
+# Pagination mode for listings: sequential, readahead or parallel
+TRR_PAGINATION = os.environ.get("TRR_PAGINATION", "sequential")
+# Processes for parsing of several reports, 0 - number of CPUs
+TRR_PARSE_WORKERS = int(os.environ.get("TRR_PARSE_WORKERS", 0))
+# Max number of memoized inputs per compiled list of string actions
+TRR_ACTIONS_CACHE_SIZE = int(os.environ.get("TRR_ACTIONS_CACHE_SIZE", 4096))
+
+# Persistent metadata cache
+TRR_METADATA_CACHE = os.environ.get(
+    "TRR_METADATA_CACHE", "false").lower() in ("1", "true", "yes")
+TRR_CACHE_DIR = os.environ.get(
+    "TRR_CACHE_DIR",
+    os.path.join(os.path.expanduser('~'), '.cache', 'testrail-reporter')
+)
+TRR_CACHE_TTL = int(os.environ.get("TRR_CACHE_TTL", 3600))
+# Per-entity TTL (seconds), e.g. TRR_CACHE_TTL_MILESTONES=600
+TRR_CACHE_TTLS = {
+    entity: int(os.environ.get("TRR_CACHE_TTL_" + entity.upper(),
+                               TRR_CACHE_TTL))
+    for entity in ('project', 'statuses', 'milestones', 'configurations',
+                   'case_fields', 'result_fields', 'priorities')
+}
+
+# Rate limit of TestRail API requests (per process)
+# Requests per second, 0 - unlimited until the server throttles requests
+TRR_RATE_LIMIT = float(os.environ.get("TRR_RATE_LIMIT", 0))
+TRR_RATE_LIMIT_MIN = float(os.environ.get("TRR_RATE_LIMIT_MIN", 0.5))
+
+# Retry policy: exponential backoff with jitter (seconds)
+TRR_RETRY_BACKOFF = float(os.environ.get("TRR_RETRY_BACKOFF", 1))
+TRR_RETRY_BACKOFF_MAX = float(os.environ.get("TRR_RETRY_BACKOFF_MAX", 60))
+# Max retries per error class, e.g. TRR_RETRIES_SERVER=5
+TRR_RETRIES = {
+    error_class: int(os.environ.get("TRR_RETRIES_" + error_class.upper(),
+                                    default))
+    for error_class, default in (('throttled', 5), ('server', 3),
+                                 ('timeout', 3), ('connection', 3))
+}
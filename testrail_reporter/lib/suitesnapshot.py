@@ -0,0 +1,40 @@
+import collections
+
+from testrail_reporter.lib.exceptions import NotFound
+
+
+class SuiteSnapshot(object):
+    """Sections and cases of a test suite indexed for fast lookups.
+
+    The snapshot is built from a single listing of sections and cases of
+    the suite. Sections and cases created afterwards should be recorded
+    with `add_section` and `add_case` to keep the snapshot up to date.
+    """
+
+    def __init__(self, suite, sections, cases):
+        self.suite = suite
+        self.sections = {}
+        self.titles = set()
+        self.section_titles = collections.defaultdict(set)
+        for section in sections:
+            self.add_section(section)
+        for case in cases:
+            self.add_case(case['section_id'], case['title'])
+
+    def add_section(self, section):
+        # The first section with the name wins, as in a listing lookup
+        self.sections.setdefault(section['name'], section['id'])
+
+    def add_case(self, section_id, title):
+        self.titles.add(title)
+        self.section_titles[section_id].add(title)
+
+    def get_section_id(self, name):
+        try:
+            return self.sections[name]
+        except KeyError:
+            raise NotFound("Can't find Section '{}' in Test Suite '{}'"
+                           "".format(name, self.suite['name']))
+
+    def has_case(self, section_id, title):
+        return title in self.section_titles[section_id]
@@ -1,8 +1,7 @@
-import copy
-
 import yaml
 
-from testrail_reporter.lib.actions import perform_actions
+from testrail_reporter.lib.actions import CompiledActions
+from testrail_reporter.lib.records import record_type
 
 
 class TestCaseParser(object):
@@ -11,19 +10,21 @@ class TestCaseParser(object):
             self.tr_case_attrs = yaml.safe_load(stream)
         with open(tr_case_map, 'r') as stream:
             self.tr_case_map = yaml.safe_load(stream)
+        self._get_title = CompiledActions(self.tr_case_map['title']['actions'])
+        self._get_section = CompiledActions(
+            self.tr_case_map['section']['actions'])
 
     def get_tc_list(self, tc_list_file):
         with open(tc_list_file, 'r') as stream:
             tc_raw_list = [line.rstrip('\n') for line in stream]
         tc_list = []
         tc_raw_list.sort()
+        case_type = record_type(self.tr_case_attrs, ('title', 'section_id'))
         for i in tc_raw_list:
-            tc = copy.copy(self.tr_case_attrs)
-            tc['title'] = perform_actions(
-                i, self.tr_case_map['title']['actions'])
+            tc = case_type(self.tr_case_attrs)
+            tc['title'] = self._get_title(i)
             assert tc['title'] is not None, "Title shouldn't be empty"
-            section_id = perform_actions(
-                i, self.tr_case_map['section']['actions'])
+            section_id = self._get_section(i)
             if section_id:
                 tc['section_id'] = section_id
             tc_list.append(tc)
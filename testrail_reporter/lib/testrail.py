@@ -12,48 +12,62 @@ http://docs.gurock.com/testrail-api2/accessing
 Copyright Gurock Software GmbH. See license.md for details.
 """
 
-import base64
 import json
 import logging
 import re
 import sys
 import time
 
-import requests
+from testrail_reporter.lib.ratelimit import get_rate_limiter
+from testrail_reporter.lib.records import to_json
+from testrail_reporter.lib.retrypolicy import RetryPolicy
+from testrail_reporter.lib.session import MultipartFile, TestRailSession
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.StreamHandler(sys.stdout))
 
 
-def retry_429(func, timeout=60):
-    def _parse_retry_time(msg):
-        pattern = r'Retry after (\d+) seconds'
-        match = re.search(pattern, msg)
-        if match:
-            return int(match.group(1))
-        else:
-            return timeout
-
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except APIError429 as e:
-            LOG.warning(f"{e.message}")
-            retry_time = _parse_retry_time(str(e.message))
-            LOG.info(f"Retry after {retry_time}")
-            time.sleep(retry_time+1)
-            return func(*args, **kwargs)
-    return wrapper
-
-
 class APIClient:
-    def __init__(self, base_url):
-        self.user = ''
-        self.password = ''
+    def __init__(self, base_url, session=None, rate_limiter=None,
+                 retry_policy=None):
+        self.session = session or TestRailSession()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._user = ''
+        self._password = ''
         if not base_url.endswith('/'):
             base_url += '/'
         self.__url = base_url + 'index.php?/api/v2/'
 
+    @property
+    def user(self):
+        return self._user
+
+    @user.setter
+    def user(self, value):
+        self._user = value
+        self.session.set_credentials(self._user, self._password)
+
+    @property
+    def password(self):
+        return self._password
+
+    @password.setter
+    def password(self, value):
+        self._password = value
+        self.session.set_credentials(self._user, self._password)
+
+    @staticmethod
+    def _get_retry_after(response, error):
+        try:
+            return float(response.headers['Retry-After'])
+        except (KeyError, ValueError):
+            pass
+        match = re.search(r'Retry after (\d+) seconds', str(error))
+        if match:
+            return int(match.group(1))
+        return None
+
     @staticmethod
     def _get_response_error(response):
         try:
@@ -81,45 +95,65 @@ class APIClient:
         Args:
             uri: The API method to call, including parameters, e.g. add_case/1.
             data: The data to submit as part of the request as a dict; strings
-                must be UTF-8 encoded. If adding an attachment, must be the
-                path to the file.
+                must be UTF-8 encoded. Bytes are sent as already serialized
+                JSON. If adding an attachment, must be the path to the file.
 
         Returns:
             A dict containing the result of the request.
         """
         return self.__send_request('POST', uri, data)
 
-    @retry_429
     def __send_request(self, method, uri, data):
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                result = self.__send_request_once(method, uri, data)
+            except Exception as e:
+                error_class = self.retry_policy.classify(e)
+                retry_after = getattr(e, 'retry_after', None)
+                if error_class == 'throttled':
+                    self.rate_limiter.on_throttled(retry_after)
+                delay = self.retry_policy.get_delay(
+                    error_class, method, attempt, retry_after,
+                    sent=self.retry_policy.is_sent(e))
+                if delay is None:
+                    raise
+                LOG.warning(f"{method} {uri} failed ({error_class}): {e}. "
+                            f"Retry after {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.rate_limiter.on_success()
+            return result
+
+    def __send_request_once(self, method, uri, data):
         url = self.__url + uri
 
-        auth = str(
-            base64.b64encode(
-                bytes('%s:%s' % (self.user, self.password), 'utf-8')
-            ),
-            'ascii'
-        ).strip()
-        headers = {'Authorization': 'Basic ' + auth}
-
         if method == 'POST':
             if uri[:14] == 'add_attachment':    # add_attachment API method
-                files = {'attachment': (open(data, 'rb'))}
-                response = requests.post(url, headers=headers, files=files)
-                files['attachment'].close()
+                body = MultipartFile(data)
+                try:
+                    response = self.session.post(
+                        url, json_body=False, content_type=body.content_type,
+                        data=body)
+                finally:
+                    body.close()
             else:
-                headers['Content-Type'] = 'application/json'
-                payload = bytes(json.dumps(data), 'utf-8')
-                response = requests.post(url, headers=headers, data=payload)
+                if isinstance(data, bytes):
+                    payload = data
+                else:
+                    payload = bytes(json.dumps(data, default=to_json), 'utf-8')
+                response = self.session.post(url, data=payload)
         else:
-            headers['Content-Type'] = 'application/json'
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url)
 
         if response.status_code > 201:
             error = self._get_response_error(response)
             if response.status_code == 429:
-                raise APIError429(error, response.status_code)
-            raise APIError('TestRail API returned HTTP %s (%s)'
-                           % (response.status_code, error))
+                raise APIError429(error, response.status_code,
+                                  self._get_retry_after(response, error))
+            raise APIError(error, response.status_code)
         else:
             if uri[:15] == 'get_attachment/':   # Expecting file, not JSON
                 try:
@@ -146,15 +180,29 @@ class APIError(Exception):
 
 
 class APIError429(APIError):
-    pass
+    def __init__(self, message="", response_code=None, retry_after=None):
+        super(APIError429, self).__init__(message, response_code)
+        self.retry_after = retry_after
 
 
 class TestRailAPICalls(object):
-    def __init__(self, url, user, password):
-        self.client = APIClient(base_url=url)
+    def __init__(self, url, user, password, session=None):
+        self.client = APIClient(base_url=url, session=session)
         self.client.user = user
         self.client.password = password
 
+    # API: Attachments
+
+    def add_attachment_to_result(self, result_id, path):
+        uri = 'add_attachment_to_result/{result_id}'.format(
+            result_id=result_id)
+        return self.client.send_post(uri, path)
+
+    def get_attachment(self, attachment_id, filepath):
+        uri = 'get_attachment/{attachment_id}'.format(
+            attachment_id=attachment_id)
+        return self.client.send_get(uri, filepath)
+
     # API: Cases
 
     def get_case(self, case_id):
@@ -349,6 +397,14 @@ class TestRailAPICalls(object):
             uri += '{}'.format(filter)
         return self.client.send_get(uri)
 
+    @staticmethod
+    def get_results_filter(status_id=None):
+        """Filter for get_results, get_results_for_case and _for_run."""
+        filter = ""
+        if status_id:
+            filter += "&status_id=" + ",".join(map(str, status_id))
+        return filter
+
     def add_result(self, test_id, data):
         uri = 'add_result/{test_id}'.format(test_id=test_id)
         return self.client.send_post(uri, data)
@@ -384,6 +440,22 @@ class TestRailAPICalls(object):
             uri += '{}'.format(filter)
         return self.client.send_get(uri)
 
+    @staticmethod
+    def get_runs_filter(created_before=None, created_by=None,
+                        is_completed=None):
+        """Filter for get_runs and get_plans.
+
+        created_before is a UNIX timestamp, created_by is a list of user ids.
+        """
+        filter = ""
+        if created_before is not None:
+            filter += "&created_before=" + str(int(created_before))
+        if created_by:
+            filter += "&created_by=" + ",".join(map(str, created_by))
+        if is_completed is not None:
+            filter += "&is_completed=" + str(int(is_completed))
+        return filter
+
     def add_run(self, project_id, data):
         uri = 'add_run/{project_id}'.format(project_id=project_id)
         return self.client.send_post(uri, data)
@@ -1,21 +1,42 @@
+import collections
 import html
 import logging
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 
+from testrail_reporter.lib.batcher import ResultBatcher
 from testrail_reporter.lib.exceptions import NotFound
+from testrail_reporter.lib.matcher import MultiPatternMatcher
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+from testrail_reporter.lib.testrailasync import (AsyncTestRailProject,
+                                                 collect, run_concurrently)
 from testrail_reporter.lib.testrailproject import TestRailProject
+from testrail_reporter.lib.uploader import BatchUploader
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.StreamHandler(sys.stdout))
 
+CheckRule = collections.namedtuple('CheckRule',
+                                   ('check', 'error_ids', 'signatures'))
+
 
 class CheckListParser(object):
+    """Check list of known issues compiled for fast matching.
+
+    Rules are indexed by test title. Error strings of all rules are
+    compiled into a single automaton, so a test log is scanned once for
+    all of them; `signatures` (regular expressions) are precompiled.
+    """
+
     def __init__(self, check_list_attrs='etc/check_list_example.yaml'):
         with open(check_list_attrs, 'r') as stream:
             self.attrs = yaml.safe_load(stream)
         self._check_structure()
+        self._compile()
 
     def _check_structure(self):
         for test in self.attrs['tests']:
@@ -27,20 +48,64 @@ class CheckListParser(object):
                 test['errors'] = None
             if 'defects' not in test:
                 test['defects'] = None
+            if 'signatures' not in test:
+                test['signatures'] = None
+
+    def _compile(self):
+        self.index = collections.defaultdict(list)
+        patterns = {}
+        for test in self.attrs['tests']:
+            error_ids = [patterns.setdefault(err, len(patterns))
+                         for err in test['errors'] or []]
+            signatures = [re.compile(signature)
+                          for signature in test['signatures'] or []]
+            self.index[test['title']].append(
+                CheckRule(test, error_ids, signatures))
+        self.matcher = MultiPatternMatcher(patterns)
+
+    def search_errors(self, text):
+        """Return ids of error strings of all rules found in text."""
+        return set(self.matcher.search(text))
 
 
 class TestRailAnalyzer:
 
     def __init__(self, project, run_name, plan_name=None,
-                 configuration=None):
+                 configuration=None, use_async=False,
+                 concurrency=TRR_CONCURRENCY, test_run=None, aproject=None):
         isinstance(project, TestRailProject)
         self.project = project
+        self.project.prefetch('statuses', 'configurations')
+        self.concurrency = concurrency
+        # A shared async project is closed by its owner
+        self.aproject = aproject
+        self._own_aproject = False
+        if use_async and aproject is None:
+            self.aproject = AsyncTestRailProject(self.project,
+                                                 concurrency=concurrency)
+            self._own_aproject = True
+        self._results = None
+        self.test_run = test_run
+        try:
+            if self.test_run is None:
+                self.test_run = self._find_test_run(run_name, plan_name,
+                                                    configuration)
+            self.tests = self._get_failed_tests()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self._own_aproject:
+            self.aproject.close()
+
+    def _find_test_run(self, run_name, plan_name, configuration):
         conf_ids = []
         if configuration:
             isinstance(configuration, dict)
             conf_ids = self.project.get_config_ids(configuration)
             conf_ids.sort()
-        self.test_run = None
+        test_run = None
         if plan_name:
             self.test_plan = self.project.get_plan_by_name(plan_name)
             for entry in self.test_plan['entries']:
@@ -48,47 +113,215 @@ class TestRailAnalyzer:
                     for run in entry['runs']:
                         run['config_ids'].sort()
                         if run['config_ids'] == conf_ids:
-                            self.test_run = self.project.get_run(run['id'])
+                            test_run = self.project.get_run(run['id'])
         else:
-            self.test_run = self.project.get_run_by_name(run_name)
-        if not self.test_run:
+            test_run = self.project.get_run_by_name(run_name)
+        if not test_run:
             raise NotFound("Can't find test run '{}' with configuration '{}'"
                            "".format(run_name, configuration))
-        self.tests = self._get_failed_tests()
+        return test_run
 
     def _get_failed_tests(self):
         status_id = self.project.get_status_by_label("failed")
         tests_filter = self.project.get_tests_filter(status_id=[status_id])
+        if self.aproject:
+            # Failed results of the run are fetched along with the tests
+            results_filter = self.project.get_results_filter(
+                status_id=[status_id])
+            tests, self._results = run_concurrently(
+                collect(self.aproject.get_tests(self.test_run['id'],
+                                                filter=tests_filter)),
+                collect(self.aproject.get_results_for_run(
+                    self.test_run['id'], filter=results_filter)))
+            return tests
         return list(self.project.get_tests(self.test_run['id'],
                                            filter=tests_filter))
 
-    def _check_errors(self, check_obj, test):
-        test_res = list(self.project.get_results(test['id']))
-        current_res = test_res[-1]
-        if check_obj['errors']:
-            for err in check_obj['errors']:
-                if not current_res['comment']:
-                    LOG.warning("Test result for {} doesn't contain any log."
-                                "".format(test["title"]))
-                    return False
-                if err in html.unescape(current_res['comment']):
-                    pass
-                else:
-                    LOG.info("Can't find string: {}".format(err))
-                    LOG.warning("Test results for {} don't match know issue."
-                                "".format(test["title"]))
-                    return False
+    @staticmethod
+    def _match_errors(rule, test, comment, found_errors):
+        check_obj = rule.check
+        if not check_obj['errors'] and not rule.signatures:
+            return True
+        if not comment:
+            LOG.warning("Test result for {} doesn't contain any log."
+                        "".format(test["title"]))
+            return False
+        for err, error_id in zip(check_obj['errors'] or [], rule.error_ids):
+            if error_id not in found_errors:
+                LOG.info("Can't find string: {}".format(err))
+                LOG.warning("Test results for {} don't match know issue."
+                            "".format(test["title"]))
+                return False
+        for signature in rule.signatures:
+            if not signature.search(comment):
+                LOG.info("Can't find pattern: {}".format(signature.pattern))
+                LOG.warning("Test results for {} don't match know issue."
+                            "".format(test["title"]))
+                return False
+        return True
+
+    def _analyzer_result(self, check_obj):
         msg = "Set by result analyzer"
         status = self.project.get_status_by_label(check_obj['status'])
         defects = check_obj['defects']
-        data = self.project.result_data(status, comment=msg, defects=defects)
-        self.project.add_result(test['id'], data)
-        LOG.info("Test '{}' set to {}".format(test["title"],
-                                              check_obj['status']))
+        return self.project.result_data(status, comment=msg, defects=defects)
+
+    @staticmethod
+    def _result_order(result):
+        return result.get('created_on') or 0, result['id']
+
+    def _get_last_results(self, tests):
+        """Return the latest failed result of every test."""
+        test_ids = {test['id'] for test in tests}
+        last_results = {}
+        if not test_ids:
+            return last_results
+        results = self._results
+        if results is None:
+            status_id = self.project.get_status_by_label("failed")
+            results = self.project.get_results_for_run(
+                self.test_run['id'],
+                filter=self.project.get_results_filter(status_id=[status_id]))
+        for res in results:
+            if res['test_id'] not in test_ids:
+                continue
+            last = last_results.get(res['test_id'])
+            if last is None or \
+                    self._result_order(res) > self._result_order(last):
+                last_results[res['test_id']] = res
+        return last_results
+
+    def _check_errors(self, check_list_obj, test, last_result):
+        """Return analyzer results of the rules matching the test."""
+        rules = check_list_obj.index.get(test['title'])
+        if not rules:
+            return []
+        if last_result is None:
+            LOG.warning("Test {} doesn't have any results."
+                        "".format(test["title"]))
+            return []
+        comment = last_result.get('comment')
+        if comment:
+            comment = html.unescape(comment)
+        found_errors = set()
+        if comment and any(rule.error_ids for rule in rules):
+            found_errors = check_list_obj.search_errors(comment)
+        results = []
+        for rule in rules:
+            if not self._match_errors(rule, test, comment, found_errors):
+                continue
+            LOG.info("Test '{}' will be set to {}".format(
+                test["title"], rule.check['status']))
+            result = self._analyzer_result(rule.check)
+            result['test_id'] = test['id']
+            results.append(result)
+        return results
+
+    def analyze_results(self, check_list_obj, tr_limit=0):
+        isinstance(check_list_obj, CheckListParser)
+        tests = [test for test in self.tests
+                 if test['title'] in check_list_obj.index]
+        last_results = self._get_last_results(tests)
+        results = []
+        for test in tests:
+            results.extend(self._check_errors(check_list_obj, test,
+                                              last_results.get(test['id'])))
+        if not results:
+            return 0
+        batcher = ResultBatcher(tr_limit)
+        # Batches are uploaded one by one unless async calls are enabled
+        uploader = BatchUploader(self.project, self.test_run['id'],
+                                 workers=self.concurrency if self.aproject
+                                 else 1)
+        uploader.upload(batcher.split(results))
+        LOG.info(f"Analyzer results were uploaded: {batcher.summary()}; "
+                 f"{uploader.summary()}.")
+        return len(results)
+
+
+class PlanAnalyzer(object):
+    """Analyze failures of all runs (or a subset) of a test plan.
+
+    Runs are analyzed concurrently; the project (metadata and connection
+    pool) and the compiled check list are shared by all of them.
+    """
+
+    def __init__(self, project, plan_name, run_name=None,
+                 configuration=None, use_async=False,
+                 concurrency=TRR_CONCURRENCY):
+        isinstance(project, TestRailProject)
+        self.project = project
+        self.project.prefetch('statuses', 'configurations')
+        self.concurrency = concurrency
+        conf_ids = None
+        if configuration:
+            isinstance(configuration, dict)
+            conf_ids = sorted(self.project.get_config_ids(configuration))
+        self.test_plan = self.project.get_plan_by_name(plan_name)
+        self.test_runs = []
+        for entry in self.test_plan['entries']:
+            if run_name is not None and entry['name'] != run_name:
+                continue
+            for run in entry['runs']:
+                if conf_ids is not None and \
+                        sorted(run['config_ids']) != conf_ids:
+                    continue
+                self.test_runs.append(run)
+        if not self.test_runs:
+            raise NotFound("Can't find test runs '{}' with configuration "
+                           "'{}' in test plan '{}'".format(
+                               run_name or '*', configuration, plan_name))
+        # The async project (and its thread pool) is shared by all runs
+        self.aproject = None
+        if use_async:
+            self.aproject = AsyncTestRailProject(self.project,
+                                                 concurrency=concurrency)
+
+    def close(self):
+        if self.aproject:
+            self.aproject.close()
+
+    @staticmethod
+    def _run_name(run):
+        if run.get('config'):
+            return "{} ({})".format(run['name'], run['config'])
+        return run['name']
+
+    def _analyze_run(self, run, check_list_obj, tr_limit):
+        analyzer = TestRailAnalyzer(self.project, run['name'], test_run=run,
+                                    concurrency=self.concurrency,
+                                    aproject=self.aproject)
+        return len(analyzer.tests), analyzer.analyze_results(check_list_obj,
+                                                             tr_limit)
 
-    def analyze_results(self, check_list_obj):
+    def analyze_results(self, check_list_obj, tr_limit=0):
         isinstance(check_list_obj, CheckListParser)
-        for test in self.tests:
-            for check_obj in check_list_obj.attrs['tests']:
-                if test['title'] == check_obj['title']:
-                    self._check_errors(check_obj, test)
+        start = time.perf_counter()
+        workers = max(min(self.concurrency, len(self.test_runs)), 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._analyze_run, run,
+                                       check_list_obj, tr_limit)
+                       for run in self.test_runs]
+        error = None
+        failed_total = 0
+        updated_total = 0
+        LOG.info("Analysis summary for test plan '{}':".format(
+            self.test_plan['name']))
+        for run, future in zip(self.test_runs, futures):
+            if future.exception() is not None:
+                error = error or future.exception()
+                LOG.error("  {}: analysis failed: {}".format(
+                    self._run_name(run), future.exception()))
+                continue
+            failed, updated = future.result()
+            failed_total += failed
+            updated_total += updated
+            LOG.info("  {}: {} failed tests, {} results set".format(
+                self._run_name(run), failed, updated))
+        LOG.info("Total: {} runs, {} failed tests, {} results set in "
+                 "{:.3f}s".format(len(self.test_runs), failed_total,
+                                  updated_total,
+                                  time.perf_counter() - start))
+        if error is not None:
+            raise error
+        return updated_total
@@ -0,0 +1,255 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from testrail_reporter.lib.exceptions import NotFound
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+from testrail_reporter.lib.testrail import TestRailAPICalls
+
+
+def run_async(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def run_concurrently(*coros):
+    async def _gather():
+        return await asyncio.gather(*coros)
+    return run_async(_gather())
+
+
+async def collect(aiterable):
+    return [item async for item in aiterable]
+
+
+class AsyncAPIClient(object):
+    """Asyncio wrapper around a synchronous APIClient.
+
+    Requests are executed in a thread pool on top of the client's pooled
+    session. The number of requests in flight is bounded by a semaphore.
+    The pool is started on the first request, `close` (or leaving the
+    `with` block) stops it.
+    """
+
+    def __init__(self, client, concurrency=TRR_CONCURRENCY):
+        self.client = client
+        self.concurrency = concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._loop = None
+        self._semaphore = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency)
+            return self._executor
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def _call(self, func, *args):
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func,
+                                              *args)
+
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    async def send_get(self, uri, filepath=None):
+        return await self._call(self.client.send_get, uri, filepath)
+
+    async def send_post(self, uri, data):
+        return await self._call(self.client.send_post, uri, data)
+
+
+class AsyncTestRailAPICalls(TestRailAPICalls):
+    """TestRail API calls returning coroutines.
+
+    All methods are inherited from TestRailAPICalls: the async client makes
+    every `self.client.send_*` call awaitable.
+    """
+
+    def __init__(self, client, concurrency=TRR_CONCURRENCY):
+        self.client = AsyncAPIClient(client, concurrency=concurrency)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncTestRailProject(AsyncTestRailAPICalls):
+    """Async facade for TestRailProject.
+
+    Shares the connection pool and metadata (statuses, configurations,
+    milestones, etc.) of the wrapped project. Paginated methods return
+    async iterators.
+    """
+    _delegated = ('statuses', 'milestones', 'configurations', 'case_fields',
+                  'result_fields', 'priorities', 'get_status_by_label',
+                  'get_config_id', 'get_config_ids', 'result_data')
+
+    def __init__(self, project, concurrency=TRR_CONCURRENCY):
+        super(AsyncTestRailProject, self).__init__(project.client,
+                                                   concurrency=concurrency)
+        self.sync = project
+        self.project = project.project
+
+    def __getattr__(self, name):
+        if name in self._delegated:
+            return getattr(self.sync, name)
+        raise AttributeError(name)
+
+    async def _get_all(self, request, entity):
+        response = await request()
+        for ent in response[entity]:
+            yield ent
+        while response["_links"]["next"]:
+            uri = response["_links"]["next"].replace("/api/v2/", '')
+            response = await self.client.send_get(uri)
+            for ent in response[entity]:
+                yield ent
+
+    def get_projects(self):
+        return self._get_all(
+            super(AsyncTestRailProject, self).get_projects, 'projects')
+
+    def get_cases(self, project_id, suite_id=None, section_id=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_cases,
+            self.project['id'], suite_id, section_id), 'cases')
+
+    def get_milestones(self, project_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_milestones,
+            project_id, filter), 'milestones')
+
+    def get_plans(self, project_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_plans,
+            project_id, filter), 'plans')
+
+    def get_results(self, test_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_results,
+            test_id, filter), 'results')
+
+    def get_results_for_case(self, run_id, case_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_results_for_case,
+            run_id, case_id, filter), 'results')
+
+    def get_results_for_run(self, run_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_results_for_run,
+            run_id, filter), 'results')
+
+    def get_runs(self, project_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_runs,
+            project_id, filter), 'runs')
+
+    def get_sections(self, project_id, suite_id):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_sections,
+            project_id, suite_id), 'sections')
+
+    def get_tests(self, run_id, filter=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_tests,
+            run_id, filter), 'tests')
+
+    def get_users(self, project_id=None):
+        return self._get_all(functools.partial(
+            super(AsyncTestRailProject, self).get_users,
+            project_id=project_id), 'users')
+
+    def get_cases_project(self, suite_id=None, section_id=None):
+        return self.get_cases(self.project['id'], suite_id, section_id)
+
+    def get_configs_project(self):
+        return self.get_configs(self.project['id'])
+
+    def get_milestones_project(self, filter=None):
+        return self.get_milestones(self.project['id'], filter)
+
+    def get_plans_project(self, filter=None):
+        return self.get_plans(self.project['id'], filter)
+
+    def add_plan_project(self, data):
+        return self.add_plan(self.project['id'], data)
+
+    def get_runs_project(self, filter=None):
+        return self.get_runs(self.project['id'], filter)
+
+    def add_run_project(self, data):
+        return self.add_run(self.project['id'], data)
+
+    def get_sections_project(self, suite_id):
+        return self.get_sections(self.project['id'], suite_id)
+
+    def add_section_project(self, data):
+        return self.add_section(self.project['id'], data)
+
+    def get_suites_project(self):
+        return self.get_suites(self.project['id'])
+
+    def add_suite_project(self, data):
+        return self.add_suite(self.project['id'], data)
+
+    def get_users_project(self):
+        return self.get_users(project_id=self.project['id'])
+
+    async def get_suite_by_name(self, name):
+        suites = await self.get_suites_project()
+        for suite in suites['suites']:
+            if suite['name'] == name:
+                return await self.get_suite(suite_id=suite['id'])
+        raise NotFound("Suite {}".format(name))
+
+    async def get_section_by_name(self, suite_id, section_name):
+        async for section in self.get_sections_project(suite_id=suite_id):
+            if section['name'] == section_name:
+                return await self.get_section(section_id=section['id'])
+
+    async def get_milestone_by_name(self, name):
+        async for m in self.get_milestones_project():
+            if m['name'] == name:
+                return await self.get_milestone(m['id'])
+
+    async def get_plan_by_name(self, name):
+        async for plan in self.get_plans_project():
+            if plan['name'] == name:
+                return await self.get_plan(plan_id=plan['id'])
+        raise NotFound("TestPlan {}".format(name))
+
+    async def get_run_by_name(self, name):
+        async for run in self.get_runs_project():
+            if run['name'] == name:
+                return await self.get_run(run_id=run['id'])
+        raise NotFound("TestRun {}".format(name))
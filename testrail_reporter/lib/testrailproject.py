@@ -1,27 +1,148 @@
+import collections
 import logging
+import re
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from testrail_reporter.lib.exceptions import NotFound
+from testrail_reporter.lib.session import TestRailSession
+from testrail_reporter.lib.settings import (TRR_CONCURRENCY,
+                                            TRR_HTTP_POOL_SIZE, TRR_PAGINATION)
 from testrail_reporter.lib.testrail import TestRailAPICalls
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.StreamHandler(sys.stdout))
 
 
+def _metadata_property(entity):
+    """Project metadata attribute loaded from TestRail on first access."""
+    def getter(self):
+        if entity not in self._metadata:
+            self.prefetch(entity)
+        return self._metadata[entity]
+
+    def setter(self, value):
+        self._metadata[entity] = value
+    return property(getter, setter)
+
+
 class TestRailProject(TestRailAPICalls):
-    def __init__(self, url, user, password, project_name, fuse=True):
-        super(TestRailProject, self).__init__(url, user, password)
-        self.project = self._get_project_by_name(project_name)
-        self.statuses = self.get_statuses()
-        milestone_f = self.get_milestones_filter(is_completed=False,
-                                                 is_started=True)
-        self.milestones = list(self.get_milestones_project(milestone_f))
-        self.configurations = self.get_configs_project()
-        self.case_fields = self.get_case_fields()
-        self.result_fields = self.get_result_fields()
-        self.priorities = self.get_priorities()
+    pagination_modes = ('sequential', 'readahead', 'parallel')
+    metadata = ('statuses', 'milestones', 'configurations', 'case_fields',
+                'result_fields', 'priorities')
+    statuses = _metadata_property('statuses')
+    milestones = _metadata_property('milestones')
+    configurations = _metadata_property('configurations')
+    case_fields = _metadata_property('case_fields')
+    result_fields = _metadata_property('result_fields')
+    priorities = _metadata_property('priorities')
+
+    def __init__(self, url, user, password, project_name, fuse=True,
+                 session=None, pagination=TRR_PAGINATION,
+                 concurrency=TRR_CONCURRENCY, cache=None):
+        if session is None:
+            # Keep a connection for every concurrent call
+            session = TestRailSession(
+                pool_size=max(TRR_HTTP_POOL_SIZE, concurrency))
+        super(TestRailProject, self).__init__(url, user, password,
+                                              session=session)
+        if pagination not in self.pagination_modes:
+            raise ValueError(f"Unknown pagination mode: {pagination}")
+        if concurrency < 1:
+            raise ValueError(f"Concurrency must be positive: {concurrency}")
+        self.pagination = pagination
+        self.concurrency = concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._in_pool = threading.local()
+        self.cache = cache
+        self._cached = set()
+        self._metadata = {}
+        self._metadata_lock = threading.Lock()
+        self.project = self._load_metadata(
+            'project', lambda: self._get_project_by_name(project_name))
         self.fuse = fuse
 
+    def prefetch(self, *entities):
+        """Load metadata entities which aren't loaded yet concurrently.
+
+        Metadata attributes (statuses, milestones, etc.) are loaded lazily
+        on first access. Prefetch them in one burst if several are needed.
+        """
+        with self._metadata_lock:
+            missing = [e for e in entities if e not in self._metadata]
+            if not missing:
+                return
+            if len(missing) == 1:
+                entity = missing[0]
+                self._metadata[entity] = self._load_metadata(
+                    entity, lambda: self._get_metadata(entity))
+                return
+            futures = {entity: self._submit(self._prefetch_entity, entity)
+                       for entity in missing}
+            for entity, future in futures.items():
+                self._metadata[entity] = future.result()
+
+    def _prefetch_entity(self, entity):
+        # Listings are paginated sequentially in the pool: waiting for
+        # pages queued behind the task could exhaust the workers.
+        self._in_pool.active = True
+        try:
+            return self._load_metadata(entity,
+                                       lambda: self._get_metadata(entity))
+        finally:
+            self._in_pool.active = False
+
+    def _submit(self, func, *args):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.concurrency)
+            return self._executor.submit(func, *args)
+
+    def close(self):
+        """Stop worker threads, they are started again when needed."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_metadata(self, entity):
+        if entity == 'milestones':
+            milestone_f = self.get_milestones_filter(is_completed=False,
+                                                     is_started=True)
+            return list(self.get_milestones_project(milestone_f))
+        elif entity == 'configurations':
+            return self.get_configs_project()
+        return getattr(self, 'get_' + entity)()
+
+    def _load_metadata(self, entity, loader):
+        if self.cache is not None:
+            value = self.cache.get(entity)
+            if value is not None:
+                self._cached.add(entity)
+                return value
+        value = loader()
+        self._cached.discard(entity)
+        if self.cache is not None and value is not None:
+            self.cache.set(entity, value)
+        return value
+
+    def refresh_metadata(self, entity):
+        """Reload metadata entity if it was taken from the cache.
+
+        Used when a lookup misses, the cached data may be outdated.
+        :return: True if the entity has been reloaded
+        """
+        if entity not in self._cached:
+            return False
+        LOG.info("Lookup in cached {} failed, reload them".format(entity))
+        self.cache.invalidate(entity)
+        setattr(self, entity, self._load_metadata(
+            entity, lambda: self._get_metadata(entity)))
+        return True
+
     def _get_project_by_name(self, project_name):
         for project in self.get_projects():
             if project['name'] == project_name:
@@ -84,14 +205,83 @@ class TestRailProject(TestRailAPICalls):
             super(TestRailProject, self).get_users(project_id=project_id),
             'users')
 
+    @staticmethod
+    def _next_uri(response):
+        return response["_links"]["next"].replace("/api/v2/", '')
+
     def _get_all(self, response, entity):
+        if getattr(self._in_pool, 'active', False):
+            yield from self._get_all_sequential(response, entity)
+        elif self.pagination == 'parallel':
+            yield from self._get_all_parallel(response, entity)
+        elif self.pagination == 'readahead':
+            yield from self._get_all_readahead(response, entity)
+        else:
+            yield from self._get_all_sequential(response, entity)
+
+    def _get_all_sequential(self, response, entity):
         for ent in response[entity]:
             yield ent
         while response["_links"]["next"]:
-            uri = response["_links"]["next"].replace("/api/v2/", '')
-            response = self.client.send_get(uri)
+            response = self.client.send_get(self._next_uri(response))
+            for ent in response[entity]:
+                yield ent
+
+    def _get_all_readahead(self, response, entity):
+        """Fetch page N+1 in background while page N is consumed."""
+        future = None
+        try:
+            while True:
+                if response["_links"]["next"]:
+                    future = self._submit(self.client.send_get,
+                                          self._next_uri(response))
+                for ent in response[entity]:
+                    yield ent
+                if future is None:
+                    return
+                response = future.result()
+                future = None
+        finally:
+            if future is not None:
+                future.cancel()
+
+    def _get_all_parallel(self, response, entity):
+        """Fetch the remaining offset windows concurrently.
+
+        The page size is taken from the first response. Up to `concurrency`
+        pages are requested ahead; items are yielded in order and the
+        fan-out stops at the first page without a next link.
+        """
+        next_link = response["_links"]["next"]
+        limit = response.get('limit')
+        if not next_link or not limit or \
+                not re.search(r'&offset=\d+', next_link):
+            yield from self._get_all_readahead(response, entity)
+            return
+        uri = self._next_uri(response)
+        offset = response.get('offset', 0) + limit
+
+        def _window_uri(window_offset):
+            return re.sub(r'&offset=\d+', f'&offset={window_offset}', uri)
+
+        futures = collections.deque()
+        try:
             for ent in response[entity]:
                 yield ent
+            while True:
+                while len(futures) < self.concurrency:
+                    futures.append(self._submit(self.client.send_get,
+                                                _window_uri(offset)))
+                    offset += limit
+                response = futures.popleft().result()
+                for ent in response[entity]:
+                    yield ent
+                if not response["_links"]["next"] or \
+                        len(response[entity]) < limit:
+                    return
+        finally:
+            for future in futures:
+                future.cancel()
 
     def get_cases_project(self, suite_id=None, section_id=None):
         return self.get_cases(self.project['id'], suite_id, section_id)
@@ -192,6 +382,8 @@ class TestRailProject(TestRailAPICalls):
         for status in self.statuses:
             if status['label'].lower() == label.lower():
                 return status['id']
+        if self.refresh_metadata('statuses'):
+            return self.get_status_by_label(label)
         raise NotFound("Status {}".format(label))
 
     def get_config_id(self, group, conf):
@@ -200,6 +392,8 @@ class TestRailProject(TestRailAPICalls):
                 for tr_conf in tr_group["configs"]:
                     if tr_conf["name"] == conf:
                         return tr_conf["id"]
+        if self.refresh_metadata('configurations'):
+            return self.get_config_id(group, conf)
         raise NotFound("Can't find configuration for plan entry:\n"
                        "{}:{}".format(group, conf))
 
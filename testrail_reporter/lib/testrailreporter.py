@@ -1,15 +1,29 @@
+import collections
 import copy
-import json
 import logging
+import math
 import sys
 from datetime import datetime
 
 import pkg_resources
 import yaml
 
-from testrail_reporter.lib.exceptions import Conflict, NotFound
-from testrail_reporter.lib.settings import TRR_TITLE_MAX_LENGTH
+from testrail_reporter.lib.attachments import AttachmentUploader
+from testrail_reporter.lib.batcher import ResultBatcher
+from testrail_reporter.lib.casecreator import CaseCreator
+from testrail_reporter.lib.deleter import RunDeleter
+from testrail_reporter.lib.exceptions import (Conflict, CreationFailed,
+                                              DeletionFailed, NotFound)
+from testrail_reporter.lib.fingerprints import FingerprintStore
+from testrail_reporter.lib.matcher import MultiPatternMatcher
+from testrail_reporter.lib.resultstream import ResultStream
+from testrail_reporter.lib.settings import (TRR_CONCURRENCY, TRR_PAGINATION,
+                                            TRR_TITLE_MAX_LENGTH)
+from testrail_reporter.lib.suitesnapshot import SuiteSnapshot
+from testrail_reporter.lib.testrailasync import (AsyncTestRailProject,
+                                                 collect, run_concurrently)
 from testrail_reporter.lib.testrailproject import TestRailProject
+from testrail_reporter.lib.uploader import BatchUploader
 
 LOG = logging.getLogger(__name__)
 LOG.addHandler(logging.StreamHandler(sys.stdout))
@@ -17,8 +31,17 @@ LOG.addHandler(logging.StreamHandler(sys.stdout))
 
 class TestRailReporter:
 
-    def __init__(self, url, user, password, project_name, attr2id_map=None):
-        self.project = TestRailProject(url, user, password, project_name)
+    def __init__(self, url, user, password, project_name, attr2id_map=None,
+                 use_async=False, concurrency=TRR_CONCURRENCY,
+                 pagination=TRR_PAGINATION, cache=None):
+        self.project = TestRailProject(url, user, password, project_name,
+                                       pagination=pagination,
+                                       concurrency=concurrency, cache=cache)
+        self.concurrency = concurrency
+        self.aproject = None
+        if use_async:
+            self.aproject = AsyncTestRailProject(self.project,
+                                                 concurrency=concurrency)
         if not attr2id_map:
             rpath = '/'.join(('etc', 'attrs2id.yaml'))
             attr2id_map = pkg_resources.resource_filename("testrail_reporter",
@@ -26,24 +49,86 @@ class TestRailReporter:
         with open(attr2id_map, 'r') as stream:
             self.attr2id_map = yaml.safe_load(stream)
 
-    def _convert_test2id(self, result, tr_tests):
+    def close(self):
+        if self.aproject:
+            self.aproject.close()
+        self.project.close()
+
+    @staticmethod
+    def index_tests(tr_tests):
+        """Build title -> test index for the tests of a run.
+
+        Titles are cut to TRR_TITLE_MAX_LENGTH the same way as result
+        titles. For duplicated titles the first test is indexed (the same
+        one a linear scan would find).
+
+        :return: tuple (index, duplicates), duplicates maps title to the
+                 number of tests sharing it
+        """
+        index = {}
+        duplicates = {}
+        for test in tr_tests:
+            title = test['title'][:TRR_TITLE_MAX_LENGTH]
+            if title in index:
+                duplicates[title] = duplicates.get(title, 1) + 1
+                continue
+            index[title] = test
+        return index, duplicates
+
+    def _convert_test2id(self, result, tests_index):
         result['test_id'] = self._check_title_length(result['test_id'])
-        for tr_res in tr_tests:
-            if result['test_id'] == tr_res['title']:
-                result['test_id'] = tr_res['id']
-                return True
-        raise NotFound("Can't find test: {}".format(result['test_id']))
+        test = tests_index.get(result['test_id'])
+        if test is None:
+            return False
+        result['test_id'] = test['id']
+        return True
 
     @staticmethod
-    def match_group2tests(group, tr_tests):
-        results = []
+    def match_groups2tests(groups, tr_tests):
+        """Propagate group (e.g. setUpClass) results to matching tests.
+
+        A test belongs to a group if the group's test_id is a substring of
+        the test title. All titles are scanned once with a multi-pattern
+        matcher. Results are ordered by group, then by test.
+        """
+        matcher = MultiPatternMatcher(group['test_id'] for group in groups)
+        matched = [[] for _ in groups]
         for test in tr_tests:
-            if group['test_id'] in test['title']:
+            for i in matcher.search(test['title']):
+                matched[i].append(test)
+        results = []
+        for group, tests in zip(groups, matched):
+            for test in tests:
                 res = copy.copy(group)
                 res['test_id'] = test['id']
                 results.append(res)
         return results
 
+    @classmethod
+    def match_group2tests(cls, group, tr_tests):
+        return cls.match_groups2tests([group], tr_tests)
+
+    @staticmethod
+    def iter_teardown_results(results, results_teardown):
+        """Yield results with comments of matching failed tearDown groups.
+
+        Results are updated in place while they are iterated.
+        """
+        if not results_teardown:
+            yield from results
+            return
+        matcher = MultiPatternMatcher(
+            res_td['test_id'] for res_td in results_teardown)
+        for res in results:
+            for i in matcher.search(res['test_id']):
+                res['comment'] += "=================================\n"
+                res['comment'] += "Some TearDown actions are failed:\n"
+                res['comment'] += "=================================\n"
+                res['comment'] += results_teardown[i]['comment']
+                LOG.warning("TestCase {} has failed TearDown action. "
+                            "Please check logs.".format(res['test_id']))
+            yield res
+
     @staticmethod
     def _check_title_length(title):
         if len(title) > TRR_TITLE_MAX_LENGTH:
@@ -68,6 +153,8 @@ class TestRailReporter:
             if test_case['milestone_id'] == i['name']:
                 test_case['milestone_id'] = i['id']
                 return True
+        if self.project.refresh_metadata('milestones'):
+            return self._convert_milestone2id(test_case)
         raise NotFound("Can't find Milestone '{}'"
                        "".format(test_case['milestone_id']))
 
@@ -76,6 +163,8 @@ class TestRailReporter:
             if test_case['priority_id'] == p['name']:
                 test_case['priority_id'] = p['id']
                 return True
+        if self.project.refresh_metadata('priorities'):
+            return self._convert_priority2id(test_case)
         raise NotFound("Can't find Priority '{}'"
                        "".format(test_case['priority_id']))
 
@@ -86,6 +175,8 @@ class TestRailReporter:
                 items = field['configs'][0]['options']['items']
                 break
         if not items:
+            if self.project.refresh_metadata('case_fields'):
+                return self.convert_customfield2id(tc, field_name)
             raise NotFound("Can't find custom filed: {}".format(field_name))
         for item in items.split('\n'):
             i, name = item.split(',')
@@ -98,8 +189,19 @@ class TestRailReporter:
             if result['status_id'].lower() == s['label'].lower():
                 result['status_id'] = s['id']
                 return True
+        if self.project.refresh_metadata('statuses'):
+            return self._convert_status2id(result)
         raise NotFound("Can't find status: {}".format(result['status_id']))
 
+    def _get_status_ids(self, labels):
+        """Return status ids by labels, NotFound is raised if unknown."""
+        status_ids = {}
+        for label in labels:
+            result = {'status_id': label}
+            self._convert_status2id(result)
+            status_ids[label] = result['status_id']
+        return status_ids
+
     def get_section_id(self, name, suite):
         for i in self.project.get_sections_project(suite['id']):
             if name == i['name']:
@@ -111,6 +213,8 @@ class TestRailReporter:
         for m in self.project.milestones:
             if m['name'] == name:
                 return m['id']
+        if self.project.refresh_metadata('milestones'):
+            return self.get_milestone_id(name)
         raise NotFound("Can't find milestone: {}".format(name))
 
     @staticmethod
@@ -136,6 +240,7 @@ class TestRailReporter:
         return descr
 
     def update_test_suite(self, name, tc_list):
+        self.project.prefetch('milestones', 'priorities', 'case_fields')
         # Check suite name and create if needed:
         try:
             suite = self.project.get_suite_by_name(name)
@@ -144,64 +249,86 @@ class TestRailReporter:
             suite = self.project.add_suite_project(suite_data)
         suite_id = suite['id']
 
+        if self.aproject:
+            sections, cases = run_concurrently(
+                collect(self.aproject.get_sections_project(suite_id)),
+                collect(self.aproject.get_cases_project(suite_id=suite_id)))
+        else:
+            sections = self.project.get_sections_project(suite_id)
+            cases = self.project.get_cases_project(suite_id=suite_id)
+        snapshot = SuiteSnapshot(suite, sections, cases)
+
         # Exclude existing cases for fast processing
         LOG.info("Exclude existing cases for fast processing:\n"
                  "Amount of test cases: {}".format(len(tc_list)))
-        cases = self.project.get_cases_project(suite_id=suite_id)
-        casetitles = [x['title'] for x in cases]
-        tc_list = [tc for tc in tc_list if tc['title'] not in casetitles]
+        tc_list = [tc for tc in tc_list if tc['title'] not in snapshot.titles]
         LOG.info("Remaining amount of test cases: {}".format(len(tc_list)))
 
-        tr_cases = {}
-        for tc in tc_list:
-            # Remove section_id from dict and convert it to id if necessary
-            section_id = tc.pop('section_id')
-            if isinstance(section_id, str):
-                try:
-                    section_id = self.get_section_id(section_id, suite)
-                except NotFound:
-                    section_data = {'name': section_id,
-                                    'suite_id': suite_id}
-                    LOG.info("Create section: {}".format(section_id))
-                    self.project.add_section_project(section_data)
-                    section_id = self.get_section_id(section_id, suite)
-
-            if isinstance(tc['type_id'], str) and tc['type_id']:
-                self._convert_casetype2id(tc)
-            if isinstance(tc['milestone_id'], str) and tc['milestone_id']:
-                self._convert_milestone2id(tc)
-            if isinstance(tc['priority_id'], str) and tc['priority_id']:
-                self._convert_priority2id(tc)
-
-            # Convert custom attributes to id
-            for custom in self.attr2id_map['attributes2id']:
-                if custom in tc:
-                    self.convert_customfield2id(tc, custom)
-                else:
-                    LOG.warning("Custom field '{}' isn't in the case "
-                                "attributes".format(custom))
-
-            if section_id not in tr_cases:
-                tr_cases[section_id] = {}
-                tr_cases[section_id]['cases'] = \
-                    self.project.get_cases_project(suite_id, section_id)
-                tr_cases[section_id]['titles'] = []
-                for tr_tc in tr_cases[section_id]['cases']:
-                    tr_cases[section_id]['titles'].append(tr_tc['title'])
-
-            # Check title length
-            tc['title'] = self._check_title_length(tc['title'])
-            if tc['title'] not in tr_cases[section_id]['titles']:
-                LOG.info("Create case: {}".format(tc['title']))
-                self.project.add_case(section_id, tc)
+        def _prepare_cases():
+            for tc in tc_list:
+                # Remove section_id from dict and convert it to id if
+                # necessary. New sections are created before their cases.
+                section_id = tc.pop('section_id')
+                if isinstance(section_id, str):
+                    try:
+                        section_id = snapshot.get_section_id(section_id)
+                    except NotFound:
+                        section_data = {'name': section_id,
+                                        'suite_id': suite_id}
+                        LOG.info("Create section: {}".format(section_id))
+                        section = self.project.add_section_project(
+                            section_data)
+                        snapshot.add_section(section)
+                        section_id = section['id']
+
+                if isinstance(tc['type_id'], str) and tc['type_id']:
+                    self._convert_casetype2id(tc)
+                if isinstance(tc['milestone_id'], str) and \
+                        tc['milestone_id']:
+                    self._convert_milestone2id(tc)
+                if isinstance(tc['priority_id'], str) and tc['priority_id']:
+                    self._convert_priority2id(tc)
+
+                # Convert custom attributes to id
+                for custom in self.attr2id_map['attributes2id']:
+                    if custom in tc:
+                        self.convert_customfield2id(tc, custom)
+                    else:
+                        LOG.warning("Custom field '{}' isn't in the case "
+                                    "attributes".format(custom))
+
+                # Check title length
+                tc['title'] = self._check_title_length(tc['title'])
+                if not snapshot.has_case(section_id, tc['title']):
+                    LOG.info("Create case: {}".format(tc['title']))
+                    snapshot.add_case(section_id, tc['title'])
+                    yield section_id, tc
+
+        # Cases are created one by one unless async calls are enabled
+        creator = CaseCreator(self.project,
+                              workers=self.concurrency if self.aproject else 1,
+                              total=len(tc_list))
+        creator.run(_prepare_cases())
+        LOG.info(creator.summary())
+        if creator.failed:
+            raise CreationFailed(
+                *["{}: {}".format(title, error)
+                  for title, error in creator.failed],
+                count=len(creator.failed))
 
     def publish_results(self, results, plan_name, suite_name, run_name,
                         milestone=None, configuration=None,
                         update_existing=False, remove_untested=False,
                         remove_skipped=False, comm_limit=0, tr_limit=10000,
-                        tr_plan_descr=None, tr_run_descr=None):
-        suite = self.project.get_suite_by_name(suite_name)
-        plans_list = self.project.get_plans_project()
+                        tr_plan_descr=None, tr_run_descr=None, delta=False):
+        self.project.prefetch('statuses', 'milestones', 'configurations')
+        if self.aproject:
+            suite, plans_list = run_concurrently(
+                self.aproject.get_suite_by_name(suite_name),
+                collect(self.aproject.get_plans_project()))
+        else:
+            suite = self.project.get_suite_by_name(suite_name)
+            plans_list = self.project.get_plans_project()
         plan = None
         run = None
         milestone_id = None
@@ -269,58 +396,107 @@ class TestRailReporter:
             self.project.update_plan_entry(plan['id'], plan_entry['id'], data)
 
         tr_tests = list(self.project.get_tests(run['id']))
-
-        # Analysis of TearDown actions should be processed for raw results to
-        # exclude false results for untested test cases.
-        for res_td in results['results_teardown']:
-            for res in results['results']:
-                if res_td['test_id'] in res['test_id']:
-                    res['comment'] += "=================================\n"
-                    res['comment'] += "Some TearDown actions are failed:\n"
-                    res['comment'] += "=================================\n"
-                    res['comment'] += res_td['comment']
-                    LOG.warning("TestCase {} has failed TearDown action. "
-                                "Please check logs.".format(res['test_id']))
-
-        for res in results['results']:
-            if isinstance(res['test_id'], str):
-                self._convert_test2id(res, tr_tests)
-            if isinstance(res['status_id'], str):
-                self._convert_status2id(res)
-            if comm_limit and len(res['comment']) > comm_limit:
-                LOG.info("Test {}: cutting the length of the comments to {} "
-                         "bytes due to capacity limit."
-                         "".format(res['test_id'], comm_limit))
-                lim = int(comm_limit/2)
-                separator = "< ----- logs were omitted due to limit ----- >"
-                res['comment'] = "\n".join([res['comment'][:lim], separator,
-                                            res['comment'][-lim:]])
-
-        for res in results['results_setup']:
+        tests_index, duplicates = self.index_tests(tr_tests)
+        if duplicates:
+            LOG.warning("Test Run contains {} duplicated titles, results will "
+                        "be reported to the first test:\n{}".format(
+                            len(duplicates),
+                            "\n".join("{} ({} tests)".format(title, num)
+                                      for title, num in duplicates.items())))
+
+        if isinstance(results, dict):
+            results = ResultStream.from_results(results)
+        # Setup and teardown groups are needed before any result is
+        # published, all titles and statuses are checked before publishing
+        # as well, so a run isn't published partially.
+        results.scan()
+        unresolved = [title for title in results.titles
+                      if isinstance(title, str) and
+                      title[:TRR_TITLE_MAX_LENGTH] not in tests_index]
+        if unresolved:
+            raise NotFound("Can't find {} tests in Test Run:\n{}".format(
+                len(unresolved), "\n".join(unresolved)))
+        status_ids = self._get_status_ids(results.statuses)
+
+        for res in results.results_setup:
             if isinstance(res['status_id'], str):
                 self._convert_status2id(res)
-            results_setup = self.match_group2tests(res, tr_tests)
-            results['results'].extend(results_setup)
-
-        res_size = sys.getsizeof(json.dumps(results['results']))
-        LOG.info(f"Size of json results is {res_size} bytes.")
-        if tr_limit and res_size > tr_limit:
-            LOG.info(f"Results data limit ({tr_limit} bytes) is exceeded. "
-                     f"Data will be divided into several requests.")
-            batch = []
-            for res in results['results']:
-                batch_size = sys.getsizeof(json.dumps(batch))
-                if batch_size + sys.getsizeof(json.dumps(res)) < tr_limit:
-                    batch.append(res)
-                else:
-                    LOG.info(f"Batch size: {batch_size} bytes. "
-                             f"Number of entries: {len(batch)}")
-                    self.project.add_results(run['id'], {'results': batch})
-                    batch = []
-        else:
-            self.project.add_results(run['id'],
-                                     {'results': results['results']})
-        LOG.info("Results were uploaded.")
+        results_setup = self.match_groups2tests(results.results_setup,
+                                                tr_tests)
+
+        def _prepare_results():
+            # Analysis of TearDown actions should be processed for raw
+            # results to exclude false results for untested test cases.
+            for res in self.iter_teardown_results(results,
+                                                  results.results_teardown):
+                if isinstance(res['test_id'], str):
+                    self._convert_test2id(res, tests_index)
+                if isinstance(res['status_id'], str):
+                    res['status_id'] = status_ids[res['status_id']]
+                if comm_limit and len(res['comment']) > comm_limit:
+                    LOG.info("Test {}: cutting the length of the comments "
+                             "to {} bytes due to capacity limit."
+                             "".format(res['test_id'], comm_limit))
+                    lim = int(comm_limit/2)
+                    separator = "< ----- logs were omitted due to limit " \
+                                "----- >"
+                    res['comment'] = "\n".join([res['comment'][:lim],
+                                                separator,
+                                                res['comment'][-lim:]])
+                yield res
+            yield from results_setup
+
+        fingerprints = None
+        upload_results = _prepare_results()
+        if delta:
+            fingerprints = FingerprintStore(run['url'])
+            # Results of a test are filtered as soon as all of them are seen
+            counts = collections.Counter(
+                tests_index[title[:TRR_TITLE_MAX_LENGTH]]['id']
+                if isinstance(title, str) else title
+                for title in results.titles)
+            counts.update(res['test_id'] for res in results_setup)
+            upload_results = fingerprints.filter_changed(upload_results,
+                                                         counts)
+
+        if tr_limit:
+            LOG.info(f"Results data will be divided into requests of "
+                     f"{tr_limit} bytes max.")
+        # Batches and files are uploaded one by one unless async calls are
+        # enabled
+        workers = self.concurrency if self.aproject else 1
+        # Attached files are uploaded once per run to the first result
+        # referencing them once it's created, other results link them
+        attachments = AttachmentUploader(self.project, workers=workers)
+
+        def _attach_files(batch, created):
+            for result, files in zip(created, batch.attachments):
+                if files:
+                    attachments.attach(result['id'], files)
+
+        batcher = ResultBatcher(tr_limit)
+        uploader = BatchUploader(self.project, run['id'], workers=workers,
+                                 on_uploaded=_attach_files)
+        while True:
+            try:
+                uploader.upload(batcher.split(
+                    attachments.link(upload_results)))
+            finally:
+                attachments.wait()
+            upload_results = attachments.deferred
+            if not upload_results:
+                break
+            LOG.info(f"{len(upload_results)} results wait for attached "
+                     f"files uploaded to other results, publish them.")
+        LOG.info(f"Results were uploaded: {batcher.summary()}; "
+                 f"{uploader.summary()}.")
+        if attachments.done or attachments.failed:
+            LOG.info(f"Attachments were uploaded: {attachments.summary()}.")
+        results.close()
+        if fingerprints is not None:
+            LOG.info(f"Delta publishing: {fingerprints.changed} of "
+                     f"{fingerprints.total} results were new or changed.")
+            fingerprints.save()
 
         rm_statuses = []
         if remove_skipped:
@@ -364,19 +540,35 @@ class TestRailReporter:
                 return False
             return True
 
-        # Cleanup Test Runs
-        for run in self.project.get_runs_project():
-            run_created_date = datetime.fromtimestamp(run['created_on'])
-            if run_created_date < date and _check_conditions(run):
-                LOG.warning(f"Deleting the test run (id: {run['id']}): {run['name']}")
-                self.project.delete_run(run['id'])
-            else:
-                LOG.info(f"Skipping the test run (id: {run['id']}): {run['name']}")
-        # Cleanup Test Plans
-        for plan in self.project.get_plans_project():
-            run_created_date = datetime.fromtimestamp(plan['created_on'])
-            if run_created_date < date and _check_conditions(plan):
-                LOG.warning(f"Deleting the test plan (id: {plan['id']}): {plan['name']}")
-                self.project.delete_plan(plan['id'])
-            else:
-                LOG.info(f"Skipping the test plan (id: {plan['id']}): {plan['name']}")
+        # Only candidates are listed, the conditions are checked again for
+        # the runs and plans returned by the API.
+        runs_filter = self.project.get_runs_filter(
+            created_before=math.ceil(date.timestamp()),
+            created_by=[user_id] if user_id else None,
+            is_completed=None if remove_completed else False)
+        if self.aproject:
+            runs, plans = run_concurrently(
+                collect(self.aproject.get_runs_project(runs_filter)),
+                collect(self.aproject.get_plans_project(runs_filter)))
+        else:
+            runs = list(self.project.get_runs_project(runs_filter))
+            plans = list(self.project.get_plans_project(runs_filter))
+        candidates = []
+        for kind, items in (('run', runs), ('plan', plans)):
+            for item in items:
+                created_date = datetime.fromtimestamp(item['created_on'])
+                if created_date < date and _check_conditions(item):
+                    candidates.append((kind, item))
+                else:
+                    LOG.info(f"Skipping the test {kind} (id: {item['id']}): "
+                             f"{item['name']}")
+        # Runs and plans are deleted one by one unless async calls are enabled
+        deleter = RunDeleter(self.project,
+                             workers=self.concurrency if self.aproject else 1)
+        deleter.run(candidates)
+        LOG.info(f"Cleanup finished: {deleter.summary()}")
+        if deleter.failed:
+            raise DeletionFailed(
+                *["{}: {}".format(name, error)
+                  for name, error in deleter.failed],
+                count=len(deleter.failed))
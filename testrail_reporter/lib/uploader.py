@@ -0,0 +1,42 @@
+import logging
+import sys
+
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+from testrail_reporter.lib.workerpool import WorkerPool
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class BatchUploader(WorkerPool):
+    """Upload add_results batches to a test run.
+
+    A batch containing a test_id of an earlier batch is started after
+    that batch, this keeps the order of results of the same test (e.g. a
+    failure followed by a setUpClass override). The first failed upload
+    stops uploading. `on_uploaded` is called with every uploaded batch and
+    the results created from it.
+    """
+    action = 'upload batch'
+    unit = 'batches'
+    verb = 'uploaded'
+    stop_on_error = True
+
+    def __init__(self, project, run_id, workers=TRR_CONCURRENCY, on_uploaded=None):
+        super(BatchUploader, self).__init__(workers)
+        self.project = project
+        self.run_id = run_id
+        self.on_uploaded = on_uploaded
+
+    def task(self, index, batch):
+        results = self.project.add_results(self.run_id, batch.payload)
+        LOG.info(f"Batch {index} uploaded: {len(batch.payload)} bytes, "
+                 f"{len(batch.test_ids)} entries")
+        if self.on_uploaded is not None:
+            self.on_uploaded(batch, results)
+
+    def keys(self, index, batch):
+        return batch.test_ids
+
+    def upload(self, batches):
+        self.run(enumerate(batches))
@@ -0,0 +1,164 @@
+import abc
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from testrail_reporter.lib.settings import TRR_CONCURRENCY
+
+LOG = logging.getLogger(__name__)
+LOG.addHandler(logging.StreamHandler(sys.stdout))
+
+
+class WorkerPool(abc.ABC):
+    """Run a TestRail request per item through a bounded thread pool.
+
+    Subclasses define `task`, items are tuples of its arguments. `run`
+    takes items from an iterable as they are produced and reads at most
+    `workers * 2` of them ahead, so preparation of the following items
+    overlaps with the requests in flight. Items sharing a key (see `keys`)
+    are run one after another in their order. `submit` queues an item
+    without blocking, `wait` blocks until the queued items are done.
+
+    A failed item doesn't stop the others, failures are collected in
+    `failed` as (label, error) pairs. If `stop_on_error` is set, no items
+    are started after a failure and the first error is raised by `run`.
+    Progress is logged every `progress_interval` seconds (0 - never).
+    """
+    action = 'process'
+    unit = 'items'
+    verb = 'processed'
+    stop_on_error = False
+
+    def __init__(self, workers=TRR_CONCURRENCY, total=0,
+                 progress_interval=0):
+        self.workers = max(workers, 1)
+        self.total = total
+        self.progress_interval = progress_interval
+        self.done = 0
+        self.failed = []
+        self.time = 0.0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._start = None
+
+    @abc.abstractmethod
+    def task(self, *args):
+        """Process one item."""
+
+    def label(self, *args):
+        """Return the item name for logs and `failed`."""
+        return str(args[0])
+
+    def keys(self, *args):
+        """Return keys of the item, items sharing a key aren't overlapped."""
+        return ()
+
+    def _succeed(self):
+        with self._lock:
+            self.done += 1
+
+    def _fail(self, args, error):
+        label = self.label(*args)
+        LOG.error(f"Failed to {self.action} {label}: {error}")
+        with self._lock:
+            self.failed.append((label, error))
+
+    def _log_progress(self, start):
+        elapsed = time.perf_counter() - start
+        done = self.done + len(self.failed)
+        rate = done / elapsed if elapsed else 0.0
+        progress = f"{done}/{self.total}" if self.total else f"{done}"
+        msg = f"Processed {progress} {self.unit} ({rate:.1f} {self.unit}/s"
+        if self.total and rate:
+            msg += f", ETA {max(self.total - done, 0) / rate:.0f}s"
+        LOG.info(msg + ")")
+
+    def run(self, items):
+        start = time.perf_counter()
+        last_progress = start
+        last_item = {}
+        waiting = []
+        running = {}
+        finished = set()
+        error = None
+        items = enumerate(items)
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                while not exhausted and error is None and \
+                        len(waiting) + len(running) < self.workers * 2:
+                    try:
+                        index, args = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    keys = self.keys(*args)
+                    deps = {last_item[key] for key in keys
+                            if key in last_item}
+                    for key in keys:
+                        last_item[key] = index
+                    waiting.append((index, args, deps))
+
+                if error is None:
+                    for item in list(waiting):
+                        if len(running) >= self.workers:
+                            break
+                        index, args, deps = item
+                        if deps <= finished:
+                            waiting.remove(item)
+                            future = executor.submit(self.task, *args)
+                            running[future] = index, args
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, args = running.pop(future)
+                    finished.add(index)
+                    if future.exception() is None:
+                        self._succeed()
+                        continue
+                    self._fail(args, future.exception())
+                    if self.stop_on_error and error is None:
+                        error = future.exception()
+                if self.progress_interval and time.perf_counter() - \
+                        last_progress >= self.progress_interval:
+                    last_progress = time.perf_counter()
+                    self._log_progress(start)
+        self.time += time.perf_counter() - start
+        if error is not None:
+            raise error
+
+    def _run_submitted(self, args):
+        try:
+            self.task(*args)
+        except Exception as e:
+            self._fail(args, e)
+        else:
+            self._succeed()
+
+    def submit(self, *args):
+        """Queue the item, it's run in background."""
+        with self._lock:
+            if self._executor is None:
+                self._start = time.perf_counter()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            self._executor.submit(self._run_submitted, args)
+
+    def wait(self):
+        """Wait for all queued items."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=True)
+        self.time += time.perf_counter() - self._start
+
+    def summary(self):
+        rate = self.done / self.time if self.time else 0.0
+        return (f"{self.done} {self.unit} {self.verb}, {len(self.failed)} "
+                f"failed in {self.time:.3f}s ({rate:.1f} {self.unit}/s) by "
+                f"{self.workers} workers")
@@ -0,0 +1,83 @@
+from testrail_reporter.lib.exceptions import UnknownAction
+
+
+def _add_string(string):
+    def step(element, res):
+        return res + string
+    return step
+
+
+def _get_attribute(attr_name):
+    def step(element, res):
+        return res + element.get(attr_name)
+    return step
+
+
+def _get_element_text(element, res):
+    return res + element.text
+
+
+def _check_parent(properties):
+    attr_name = properties['attribute']
+    nested = compile_xml_actions(properties['xml_actions'])
+
+    def step(element, res):
+        if attr_name in element.attrib:
+            res += nested(element, res)
+        return res
+    return step
+
+
+def _check_child(properties):
+    tag = properties.get('tag')
+    attr_name = properties.get('attribute')
+    nested = compile_xml_actions(properties['xml_actions'])
+
+    def step(element, res):
+        for subchild in element:
+            if tag is not None and subchild.tag != tag:
+                continue
+            if attr_name is not None and attr_name not in subchild.attrib:
+                continue
+            res += nested(subchild, res)
+            break
+        return res
+    return step
+
+
+def _compile_action(action):
+    if 'add_string' in action:
+        return _add_string(action['add_string'])
+    elif 'get_attribute' in action:
+        return _get_attribute(action['get_attribute'])
+    elif 'get_element_text' in action:
+        return _get_element_text
+    elif 'check' in action:
+        steps = []
+        if 'parent' in action['check']:
+            steps.append(_check_parent(action['check']['parent']))
+        if 'child' in action['check']:
+            steps.append(_check_child(action['check']['child']))
+        return _chain(steps)
+    raise UnknownAction(action=action)
+
+
+def _chain(steps):
+    if len(steps) == 1:
+        return steps[0]
+
+    def run(element, res):
+        for step in steps:
+            res = step(element, res)
+        return res
+    return run
+
+
+def compile_xml_actions(actions):
+    """Compile xml_actions of a result map into an extractor function.
+
+    The map is validated during compilation (UnknownAction is raised for
+    unsupported actions). The returned function takes an xml element and
+    an initial string and returns the string built by the actions.
+    """
+    return _chain([_compile_action(action) for action in actions])
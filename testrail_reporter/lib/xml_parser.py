@@ -1,145 +1,263 @@
-import copy
+import collections
+import os
 import re
 import xml.etree.ElementTree as ET
 
-from testrail_reporter.lib.actions import perform_actions
-from testrail_reporter.lib.exceptions import UnknownAction
+from testrail_reporter.lib.actions import CompiledActions
+from testrail_reporter.lib.records import record_type
 from testrail_reporter.lib.reportparser import ReportParser
+from testrail_reporter.lib.xml_actions import compile_xml_actions
+
+
+class _BoundedText(object):
+    """Text collected from chunks keeping only its head and tail.
+
+    The bounded text, including the omission marker, is never longer than
+    the limit, so it isn't cut again by the comment limit. With `pattern`,
+    the first group of its matches is collected from the whole text while
+    it's streamed, omitted parts included. Matches can't span lines.
+    """
+    separator = "< ----- {} characters of logs were omitted ----- >"
+    # Room for the separator with any count of omitted characters
+    reserve = len(separator.format(10 ** 20)) + 2
+
+    # Max length of a match split between chunks
+    overlap = 4096
+
+    def __init__(self, limit, pattern=None):
+        self.limit = limit
+        self.pattern = pattern
+        self.matches = []
+        self._pending = ''
+        self.size = max(int((limit - self.reserve) / 2), 0)
+        # Without room for the marker only the head of the text is kept
+        self.marker = self.size > 0
+        if not self.marker:
+            self.size = limit
+        self.head = []
+        self.head_len = 0
+        self.tail = collections.deque()
+        self.tail_len = 0
+        self.omitted = 0
+
+    def _scan(self, chunk):
+        text = self._pending + chunk
+        end = 0
+        for match in self.pattern.finditer(text):
+            self.matches.append(match.group(1))
+            end = match.end()
+        # Keep the unfinished line, it may hold a part of a match
+        start = max(end, text.rfind('\n') + 1, len(text) - self.overlap)
+        self._pending = text[start:]
+
+    def add(self, chunk):
+        if self.pattern is not None:
+            self._scan(chunk)
+        if self.head_len < self.size:
+            part = chunk[:self.size - self.head_len]
+            self.head.append(part)
+            self.head_len += len(part)
+            chunk = chunk[len(part):]
+        if not chunk:
+            return
+        self.tail.append(chunk)
+        self.tail_len += len(chunk)
+        # Drop chunks which aren't needed for the tail. The text is kept
+        # whole until it's known to exceed the limit.
+        while len(self.tail) > 1 and \
+                self.tail_len - len(self.tail[0]) >= self.limit - self.size:
+            dropped = self.tail.popleft()
+            self.tail_len -= len(dropped)
+            self.omitted += len(dropped)
+
+    def value(self):
+        tail = ''.join(self.tail)
+        if self.head_len + self.omitted + len(tail) <= self.limit:
+            return ''.join(self.head) + tail
+        if not self.marker:
+            return ''.join(self.head)
+        extra = max(len(tail) - self.size, 0)
+        separator = self.separator.format(self.omitted + extra)
+        return "\n".join([''.join(self.head), separator, tail[extra:]])
+
+
+class _BoundedTextTarget(object):
+    """Parser target building elements with text bounded to the limit.
+
+    Start and end events are collected like in iterparse. With `pattern`,
+    its matches in the whole (not bounded) text of elements are collected
+    in `matches` by element.
+    """
+
+    def __init__(self, limit, pattern=None):
+        self.limit = limit
+        self.pattern = pattern
+        self.builder = ET.TreeBuilder()
+        self.events = []
+        self.matches = {}
+        self._stack = []
+        self._text = None
+
+    def _flush(self):
+        if self._text is not None:
+            self.builder.data(self._text.value())
+            # The text belongs to the innermost open element (its text or
+            # the tail of its child)
+            if self._text.matches and self._stack:
+                self.matches.setdefault(self._stack[-1], []).extend(
+                    self._text.matches)
+            self._text = None
+
+    def start(self, tag, attrib):
+        self._flush()
+        elem = self.builder.start(tag, attrib)
+        self._stack.append(elem)
+        self.events.append(('start', elem))
+
+    def end(self, tag):
+        self._flush()
+        self._stack.pop()
+        self.events.append(('end', self.builder.end(tag)))
+
+    def data(self, data):
+        if self._text is None:
+            self._text = _BoundedText(self.limit, self.pattern)
+        self._text.add(data)
+
+    def close(self):
+        self._flush()
+        return self.builder.close()
+
+    def pop_events(self):
+        events = self.events
+        self.events = []
+        return events
 
 
 class XMLParser(ReportParser):
+    # Attachments of the JUnit Attachments Jenkins plugin
+    attachment_re = re.compile(r'\[\[ATTACHMENT\|(.+?)\]\]')
+
+    def __init__(self, file, tr_result_attrs, tr_result_map, text_limit=0,
+                 attachments=False):
+        super(XMLParser, self).__init__(file, tr_result_attrs, tr_result_map,
+                                        text_limit, attachments)
+        # Attachments found while bounded texts are parsed, by element
+        self._text_attachments = None
+        self._result_type = record_type(
+            self.tr_result_attrs,
+            ('test_id', 'status_id', 'comment', 'attachments'))
+        # Compile result map once, unknown actions are reported here
+        self._get_test_id = compile_xml_actions(
+            self.tr_result_map['test_id']['xml_actions'])
+        self._get_status_id = compile_xml_actions(
+            self.tr_result_map['status_id']['xml_actions'])
+        self._default_status_id = self.tr_result_map['status_id']['default']
+        self._get_comment = compile_xml_actions(
+            self.tr_result_map['comment']['xml_actions'])
+        self._filters = []
+        for group, name in (('results_setup', 'filter_setup'),
+                            ('results_teardown', 'filter_teardown')):
+            if name in self.tr_result_map:
+                self._filters.append((
+                    group,
+                    re.compile(self.tr_result_map[name]['match']).match,
+                    CompiledActions(self.tr_result_map[name]['actions'])))
+
+    def _get_result(self, child):
+        tc_res = self._result_type(self.tr_result_attrs)
+
+        # Get test name:
+        tc_res['test_id'] = self._get_test_id(child, '')
+        if not tc_res['test_id']:
+            Exception("Test_id (title) can'be empty")
+
+        # Get test status:
+        tc_res['status_id'] = self._get_status_id(child, '') or \
+            self._default_status_id
+
+        # Get comments (logs):
+        tc_res['comment'] = self._get_comment(child, '')
 
-    def _get_result_testsuite(self, testsuite):
-        for child in testsuite:
-            if child.tag != self.tr_result_map['tc_tag']:
+        if self.attachments:
+            tc_res['attachments'] = self._get_attachments(child)
+        return tc_res
+
+    def _get_attachments(self, child):
+        """Return paths of files attached to the test case.
+
+        Attachments are 'attachment*' properties of the test case and
+        [[ATTACHMENT|path]] lines of system-out/system-err. Relative paths
+        are relative to the report directory.
+        """
+        paths = []
+        for elem in child.iter():
+            if elem.tag == 'property' and \
+                    elem.get('name', '').startswith('attachment'):
+                paths.append(elem.get('value'))
+            elif elem.tag in ('system-out', 'system-err'):
+                if self._text_attachments is not None:
+                    paths.extend(self._text_attachments.pop(elem, ()))
+                elif elem.text:
+                    paths.extend(self.attachment_re.findall(elem.text))
+        report_dir = os.path.dirname(self.file)
+        return [os.path.join(report_dir, path.strip())
+                for path in paths if path and path.strip()]
+
+    def _iter_events(self):
+        if not self.text_limit:
+            yield from ET.iterparse(self.file, events=('start', 'end'))
+            return
+        # Attachment markers are taken from texts before they're bounded
+        target = _BoundedTextTarget(
+            self.text_limit, self.attachment_re if self.attachments else None)
+        self._text_attachments = target.matches
+        parser = ET.XMLParser(target=target)
+        with open(self.file, 'rb') as stream:
+            for chunk in iter(lambda: stream.read(65536), b''):
+                parser.feed(chunk)
+                yield from target.pop_events()
+        parser.close()
+        yield from target.pop_events()
+
+    def iter_raw_results(self):
+        """Parse the report incrementally and yield raw results.
+
+        Test case elements are expected to be children of the root
+        'testsuite' element or of any child of the root 'testsuites'
+        element. Every processed element is cleared right away, so memory
+        consumption doesn't depend on the report size. With text_limit
+        only the head and the tail of every text (e.g. failure logs) are
+        kept while parsing, so the text fits the limit.
+        """
+        tc_tag = self.tr_result_map['tc_tag']
+        tc_depth = 1
+        stack = []
+        for event, elem in self._iter_events():
+            if event == 'start':
+                if not stack and elem.tag == "testsuites":
+                    tc_depth = 2
+                stack.append(elem)
                 continue
-            tc_res = copy.copy(self.tr_result_attrs)
-
-            # Get test name:
-            tc_res['test_id'] = self.perform_xml_actions(
-                child, self.tr_result_map['test_id']['xml_actions']
-            )
-            if not tc_res['test_id']:
-                Exception("Test_id (title) can'be empty")
-
-            # Get test status:
-            tc_res['status_id'] = self.perform_xml_actions(
-                child, self.tr_result_map['status_id']['xml_actions']
-            )
-            if not tc_res['status_id']:
-                tc_res['status_id'] = \
-                    self.tr_result_map['status_id']['default']
-
-            # Get comments (logs):
-            tc_res['comment'] = self.perform_xml_actions(
-                child, self.tr_result_map['comment']['xml_actions']
-            )
-            self.raw_results.append(tc_res)
-
-    def get_result_list(self):
-        tree = ET.parse(self.file)
-        root = tree.getroot()
-
-        if root.tag == "testsuites":
-            for testsuite in root:
-                self._get_result_testsuite(testsuite)
-        else:
-            self._get_result_testsuite(root)
-
-        results = {'results': [],
-                   'results_setup': [],
-                   'results_teardown': []}
-        for res in self.raw_results:
-            if 'filter_setup' in self.tr_result_map:
-                pattern = self.tr_result_map['filter_setup']['match']
-                actions = self.tr_result_map['filter_setup']['actions']
-                if re.match(pattern, res['test_id']):
-                    out = perform_actions(res['test_id'],
-                                          actions)
-                    res['test_id'] = out
-                    results['results_setup'].append(res)
-                    continue
-
-            if 'filter_teardown' in self.tr_result_map:
-                pattern = self.tr_result_map['filter_teardown']['match']
-                actions = self.tr_result_map['filter_teardown']['actions']
-                if re.match(pattern, res['test_id']):
-                    out = perform_actions(res['test_id'],
-                                          actions)
-                    res['test_id'] = out
-                    results['results_teardown'].append(res)
-                    continue
-            results['results'].append(res)
-        return results
-
-    @staticmethod
-    def action_get_attribute(child, attr_name):
-        for key, value in child.attrib.items():
-            if key == attr_name:
-                return value
-
-    @staticmethod
-    def action_get_element_text(child):
-        return child.text
-
-    @staticmethod
-    def action_check_child(child, attr_name):
-        for key, value in child.attrib.items():
-            if key == attr_name:
-                return value
-
-    @staticmethod
-    def check_attribute(child, attr_name):
-        if attr_name in child.attrib.keys():
-            return True
-        else:
-            return False
-
-    @staticmethod
-    def return_subchild(child, properties):
-        for subchild in child:
-            tag = False
-            attr = False
-            if 'tag' in properties:
-                if subchild.tag == properties['tag']:
-                    tag = True
-            else:
-                tag = True
-            if 'attribute' in properties:
-                for attr in subchild.attrib.keys():
-                    if attr == properties['attribute']:
-                        attr = True
-            else:
-                attr = True
-
-            if tag and attr:
-                return subchild
-        return None
+            stack.pop()
+            depth = len(stack)
+            if depth == tc_depth and elem.tag == tc_tag:
+                yield self._get_result(elem)
+            if 0 < depth <= tc_depth:
+                # Drop processed elements from the tree
+                elem.clear()
+                del stack[-1][:]
+
+    def _get_group(self, res):
+        for group, match, actions in self._filters:
+            if match(res['test_id']):
+                res['test_id'] = actions(res['test_id'])
+                return group
+        return 'results'
+
+    def iter_results(self):
+        for res in self.iter_raw_results():
+            yield self._get_group(res), res
 
     def perform_xml_actions(self, child, actions, res=''):
-        for action in actions:
-            if 'add_string' in action:
-                res += action['add_string']
-            elif 'get_attribute' in action:
-                attr_name = action['get_attribute']
-                res += self.action_get_attribute(child, attr_name)
-            elif 'get_element_text' in action:
-                res += self.action_get_element_text(child)
-            elif 'check' in action:
-                if 'parent' in action['check']:
-                    nested = action['check']['parent']
-                    attr_name = nested['attribute']
-                    if self.check_attribute(child, attr_name):
-                        res += self.perform_xml_actions(child,
-                                                        nested['xml_actions'],
-                                                        res=res)
-                if 'child' in action['check']:
-                    nested = action['check']['child']
-                    subchild = self.return_subchild(child, nested)
-                    if subchild is not None:
-                        res += self.perform_xml_actions(subchild,
-                                                        nested['xml_actions'],
-                                                        res=res)
-            else:
-                raise UnknownAction(action=action)
-        return res
+        return compile_xml_actions(actions)(child, res)